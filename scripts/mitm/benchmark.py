@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the failures.py addons against a local fake Ethereum JSON-RPC
+server, reporting throughput, p50/p99 added latency and RSS for each failure
+class and ratio.
+
+Two modes:
+- addons (default): the addons hooks are driven in-process with mitmproxy's
+  test helpers, on requests and responses exchanged with the fake server.
+  The added latency is the time spent in the hooks. Each class and ratio
+  runs in a fresh interpreter, so its RSS is its own and not that of every
+  run before it.
+- mitmdump: a real mitmdump runs in reverse mode in front of the fake server
+  with the addon loaded. The added latency is the proxied latency minus the
+  direct one, and RSS is the mitmdump one.
+
+Usage, from an environment with mitmproxy installed:
+    python3 scripts/mitm/benchmark.py
+    python3 scripts/mitm/benchmark.py --payload logs --ratios 0.1 1.0 \\
+        --classes CorruptedJSONResponse CorruptedBytesResponse
+    python3 scripts/mitm/benchmark.py --mode mitmdump --concurrency 8
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CLASSES = [
+    "HttpErrorResponse",
+    "CorruptedJSONResponse",
+    "CorruptedBytesResponse",
+    "AddJSONFieldsResponse",
+    "RemoveJSONFieldsResponse",
+    "WrongContentTypeResponse",
+    "BatchErrorResponse",
+    "BatchCorruptedResponse",
+    "LaggedChainView",
+]
+DEFAULT_RATIOS = [0.0, 0.1, 1.0]
+
+# Realistic L1 payloads: a full block with 200 transactions is ~130KB,
+# 5000 logs are ~4MB
+BLOCK_TRANSACTIONS = 200
+LOGS = 5000
+
+
+def _tx(i):
+    return {
+        "blockHash": "0x" + "ab" * 32,
+        "blockNumber": "0x1000",
+        "from": "0x" + "11" * 20,
+        "gas": "0x5208",
+        "gasPrice": "0x3b9aca00",
+        "hash": "0x" + f"{i:064x}",
+        "input": "0x" + "00" * 200,
+        "nonce": hex(i),
+        "to": "0x" + "22" * 20,
+        "transactionIndex": hex(i),
+        "value": "0x0",
+        "type": "0x2",
+        "v": "0x1",
+        "r": "0x" + "33" * 32,
+        "s": "0x" + "44" * 32,
+    }
+
+
+def _block(number, full=True):
+    return {
+        "number": hex(number),
+        "hash": "0x" + f"{number:064x}",
+        "parentHash": "0x" + f"{number - 1:064x}",
+        "timestamp": hex(1700000000 + number * 12),
+        "gasUsed": "0x1c9c380",
+        "gasLimit": "0x1c9c380",
+        "extraData": "0x",
+        "miner": "0x" + "55" * 20,
+        "logsBloom": "0x" + "00" * 256,
+        "transactions":
+            [_tx(i) for i in range(BLOCK_TRANSACTIONS)] if full
+            else ["0x" + f"{i:064x}" for i in range(BLOCK_TRANSACTIONS)],
+    }
+
+
+def _log(i):
+    return {
+        "address": "0x" + "66" * 20,
+        "topics": ["0x" + "77" * 32, "0x" + f"{i:064x}"],
+        "data": "0x" + "88" * 128,
+        "blockNumber": hex(4096 + i // 10),
+        "blockHash": "0x" + "ab" * 32,
+        "transactionHash": "0x" + f"{i:064x}",
+        "transactionIndex": hex(i % 10),
+        "logIndex": hex(i),
+        "removed": False,
+    }
+
+
+RESULTS = {
+    "eth_blockNumber": hex(4096),
+    "eth_getBlockByNumber": _block(4096),
+    "eth_getLogs": [_log(i) for i in range(LOGS)],
+}
+
+# Request bodies for each payload kind
+PAYLOADS = {
+    "small": {"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber"},
+    "block": {
+        "jsonrpc": "2.0", "id": 1, "method": "eth_getBlockByNumber",
+        "params": ["latest", True],
+    },
+    "logs": {
+        "jsonrpc": "2.0", "id": 1, "method": "eth_getLogs",
+        "params": [{"fromBlock": "0x1000", "toBlock": "0x11f4"}],
+    },
+    "batch": [
+        {
+            "jsonrpc": "2.0", "id": i, "method": "eth_getBlockByNumber",
+            "params": [hex(4096 - i), False],
+        }
+        for i in range(20)
+    ],
+}
+
+
+class FakeRPCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Pre-serialized results, so the server is never the bottleneck
+    serialized = {
+        method: json.dumps(result) for method, result in RESULTS.items()
+    }
+    serialized["eth_getBlockByNumber.light"] = \
+        json.dumps(_block(4096, full=False))
+
+    def _answer(self, request):
+        method = request.get("method")
+        if method == "eth_getBlockByNumber" and not request["params"][1]:
+            method += ".light"
+        result = self.serialized.get(method, "null")
+        return f'{{"jsonrpc":"2.0","id":{json.dumps(request.get("id"))},' \
+            f'"result":{result}}}'
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        request = json.loads(self.rfile.read(length))
+        if isinstance(request, list):
+            body = "[" + ",".join(self._answer(r) for r in request) + "]"
+        else:
+            body = self._answer(request)
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_fake_rpc():
+    server = ThreadingHTTPServer(("127.0.0.1", _free_port()), FakeRPCHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _rss_mb(pid="self"):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _post(conn, body):
+    conn.request(
+        "POST", "/", body, {"Content-Type": "application/json"}
+    )
+    response = conn.getresponse()
+    return response.status, dict(response.getheaders()), response.read()
+
+
+def _addon(failures, cls, ratio):
+    return getattr(failures, cls)(ratio, seed=1)
+
+
+def _run_addons(cls, ratio, payload, flows, port):
+    sys.path.insert(0, SCRIPT_DIR)
+    import mitmproxy.proxy.layers.http as layers  # registers the hooks
+    from mitmproxy.http import Response
+    from mitmproxy.test import taddons, tflow
+    import failures
+
+    body = json.dumps(PAYLOADS[payload]).encode()
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+
+    async def run():
+        latencies = []
+        with taddons.context() as tctx:
+            if cls != "none":
+                tctx.master.addons.add(
+                    _addon(failures, cls, ratio), failures.JSONBodyFlush()
+                )
+            for _ in range(flows):
+                flow = tflow.tflow()
+                flow.request.headers["Content-Type"] = "application/json"
+                flow.request.content = body
+
+                start = time.perf_counter()
+                await tctx.master.addons.handle_lifecycle(
+                    layers.HttpRequestHeadersHook(flow)
+                )
+                await tctx.master.addons.handle_lifecycle(
+                    layers.HttpRequestHook(flow)
+                )
+                elapsed = time.perf_counter() - start
+
+                if flow.response is None:
+                    status, headers, content = \
+                        _post(conn, flow.request.content)
+                    flow.response = Response.make(
+                        status, content, headers
+                    )
+
+                start = time.perf_counter()
+                await tctx.master.addons.handle_lifecycle(
+                    layers.HttpResponseHook(flow)
+                )
+                latencies.append(elapsed + time.perf_counter() - start)
+        return latencies
+
+    latencies = asyncio.run(run())
+    return latencies, sum(latencies), _rss_mb()
+
+
+def bench_addons(cls, ratio, payload, flows, port):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_addons, (cls, ratio, payload, flows, port))
+
+
+def _timed_requests(port, body, flows, concurrency):
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection("127.0.0.1", port)
+        start = time.perf_counter()
+        try:
+            _post(local.conn, body)
+        except (http.client.HTTPException, OSError):
+            # Killed or broken flows, reconnect for the next one
+            local.conn = http.client.HTTPConnection("127.0.0.1", port)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one, range(flows)))
+    return latencies, time.perf_counter() - start
+
+
+def bench_mitmdump(cls, ratio, payload, flows, port, concurrency):
+    body = json.dumps(PAYLOADS[payload]).encode()
+    direct, _ = _timed_requests(port, body, flows, concurrency)
+
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".py", dir=SCRIPT_DIR, delete=False
+    ) as script:
+        script.write("import failures\n")
+        if cls == "none":
+            script.write("addons = []\n")
+        else:
+            script.write(
+                f"addons = [failures.{cls}({ratio}, seed=1), "
+                "failures.JSONBodyFlush()]\n"
+            )
+    proxy_port = _free_port()
+    proxy = subprocess.Popen(
+        [
+            "mitmdump", "--mode", f"reverse:http://127.0.0.1:{port}",
+            "-p", str(proxy_port), "-q", "-s", script.name,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", proxy_port)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        proxied, elapsed = \
+            _timed_requests(proxy_port, body, flows, concurrency)
+        rss = _rss_mb(proxy.pid)
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        os.remove(script.name)
+
+    baseline = _percentile(direct, 0.5)
+    return [max(0.0, x - baseline) for x in proxied], elapsed, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the failures.py mitm addons"
+    )
+    parser.add_argument("--mode", choices=["addons", "mitmdump"],
+                        default="addons")
+    parser.add_argument("--classes", nargs="+", default=DEFAULT_CLASSES,
+                        help="Failure classes, none for a baseline")
+    parser.add_argument("--ratios", nargs="+", type=float,
+                        default=DEFAULT_RATIOS)
+    parser.add_argument("--payload", choices=list(PAYLOADS),
+                        default="block")
+    parser.add_argument("--flows", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Concurrent clients, mitmdump mode only")
+    args = parser.parse_args()
+
+    server = _start_fake_rpc()
+    port = server.server_address[1]
+
+    print(
+        f"{'class':<28} {'ratio':>6} {'flows/s':>10} "
+        f"{'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>8}"
+    )
+    for cls in ["none"] + [c for c in args.classes if c != "none"]:
+        for ratio in [0.0] if cls == "none" else args.ratios:
+            if args.mode == "addons":
+                latencies, elapsed, rss = bench_addons(
+                    cls, ratio, args.payload, args.flows, port
+                )
+            else:
+                latencies, elapsed, rss = bench_mitmdump(
+                    cls, ratio, args.payload, args.flows, port,
+                    args.concurrency
+                )
+            print(
+                f"{cls:<28} {ratio:>6} {len(latencies) / elapsed:>10.0f} "
+                f"{_percentile(latencies, 0.5) * 1000:>9.3f} "
+                f"{_percentile(latencies, 0.99) * 1000:>9.3f} "
+                f"{rss:>8.1f}"
+            )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import failures
+
+addons = [
+    failures.FaultCampaign(
+        os.environ.get("MITM_CAMPAIGN", "/scripts/campaign.yml")
+    ),
+]
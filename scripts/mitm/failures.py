@@ -1,29 +1,401 @@
+import asyncio
 import json
-from time import sleep
-from random import randint
+import logging
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from urllib.parse import urlsplit
 from mitmproxy import http  # noqa
 from mitmproxy.script import concurrent  # noqa
 
 
+# JSON body cache
+#
+# Response bodies are decoded at most once per flow and shared by every
+# addon in the chain. Mutations are made on the cached object and written
+# back to the flow once, by JSONBodyFlush, which should be the last addon.
+# JSONBodyFlush marks each flow it will see with DEFER_FLUSH_KEY; without
+# the mark, every mutating addon writes back on its own, unless it runs under
+# a FailureRouter, which writes back once at its end.
+
+JSON_BODY_KEY = "failures.json_body"
+JSON_REQUEST_KEY = "failures.json_request"
+DEFER_FLUSH_KEY = "failures.defer_flush"
+_INVALID_JSON = object()
+
+
+class _JSONBody:
+    __slots__ = ("raw", "value", "dirty", "faults")
+
+    def __init__(self, raw, value):
+        self.raw = raw
+        self.value = value
+        self.dirty = False
+        self.faults = []
+
+
+def _json_body(flow):
+    """
+    Return the decoded JSON response body, or None if it is not JSON.
+    The cache is invalidated whenever the raw body changes under it.
+    """
+    if flow.response.headers.get("Content-Type") != "application/json":
+        return None
+
+    raw = flow.response.raw_content
+    cached = flow.metadata.get(JSON_BODY_KEY)
+    if cached is None or cached.raw is not raw:
+        try:
+            value = json.loads(flow.response.content)
+        except (TypeError, ValueError):
+            value = _INVALID_JSON
+        cached = _JSONBody(raw, value)
+        flow.metadata[JSON_BODY_KEY] = cached
+
+    return None if cached.value is _INVALID_JSON else cached.value
+
+
+def _json_request(flow):
+    """
+    Return the decoded JSON-RPC request (a dict, or a list for batches), or
+    None if it is not JSON. Cached like response bodies, but never mutated:
+    addons rewriting the request set flow.request.text themselves.
+    """
+    content_type = flow.request.headers.get("Content-Type", "")
+    if not content_type.startswith("application/json"):
+        return None
+
+    raw = flow.request.raw_content
+    cached = flow.metadata.get(JSON_REQUEST_KEY)
+    if cached is None or cached.raw is not raw:
+        try:
+            value = json.loads(flow.request.content)
+        except (TypeError, ValueError):
+            value = _INVALID_JSON
+        cached = _JSONBody(raw, value)
+        flow.metadata[JSON_REQUEST_KEY] = cached
+
+    return None if cached.value is _INVALID_JSON else cached.value
+
+
+def _mark_json_body_dirty(flow, failure):
+    cached = flow.metadata[JSON_BODY_KEY]
+    cached.dirty = True
+    cached.faults.append(failure.name)
+    if not flow.metadata.get(DEFER_FLUSH_KEY):
+        _flush_json_body(flow)
+
+
+def _flush_json_body(flow):
+    cached = flow.metadata.get(JSON_BODY_KEY)
+    if cached is None or not cached.dirty:
+        return
+
+    flow.response.text = json.dumps(cached.value)
+    cached.raw = flow.response.raw_content
+    cached.dirty = False
+    for fault in cached.faults:
+        METRICS.rewritten(flow, fault, len(cached.raw))
+    cached.faults = []
+
+
+def _json_result(flow):
+    body = _json_body(flow)
+    if isinstance(body, dict) and body.get("result"):
+        return body["result"]
+    return None
+
+
+def _peer_addr(flow):
+    _peer = flow.client_conn.peername
+    return _peer[0] if _peer else None
+
+
+def _request_method(flow):
+    content = _json_request(flow)
+    return content.get("method") if isinstance(content, dict) else None
+
+
+# Metrics
+#
+# Counters and histograms of what the failures did, per fault, JSON-RPC
+# method and peer. They are always collected, and served in the Prometheus
+# text format by FaultMetricsExporter (see metrics.py), which also counts
+# every flow going through the proxy.
+
+DELAY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+def _metric_method(flow):
+    content = _json_request(flow)
+    if isinstance(content, list):
+        return "batch"
+    if isinstance(content, dict):
+        return str(content.get("method"))
+    return ""
+
+
+class FaultMetrics:
+    HELP = {
+        "mitm_flows_total": ("counter", "Flows seen by the proxy"),
+        "mitm_faults_injected_total": ("counter", "Faults injected"),
+        "mitm_bytes_rewritten_total":
+            ("counter", "Response bytes written by faults"),
+        "mitm_fault_delay_seconds":
+            ("histogram", "Delay added to responses by faults"),
+        "mitm_cache_hits_total":
+            ("counter", "Requests answered from the proxy cache"),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                # Bucket counts, then sum and count
+                h = self.histograms[key] = [0] * (len(DELAY_BUCKETS) + 2)
+            for i, bucket in enumerate(DELAY_BUCKETS):
+                if value <= bucket:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def flow(self, flow):
+        self.inc(
+            "mitm_flows_total",
+            (("method", _metric_method(flow)), ("peer", _peer_addr(flow))),
+        )
+
+    def injected(self, flow, fault, method=None):
+        if method is None:
+            method = _metric_method(flow)
+        self.inc(
+            "mitm_faults_injected_total",
+            (("fault", fault), ("method", method), ("peer", _peer_addr(flow))),
+        )
+
+    def rewritten(self, flow, fault, size):
+        self.inc(
+            "mitm_bytes_rewritten_total",
+            (
+                ("fault", fault),
+                ("method", _metric_method(flow)),
+                ("peer", _peer_addr(flow)),
+            ),
+            size,
+        )
+
+    def delayed(self, flow, fault, seconds):
+        self.observe(
+            "mitm_fault_delay_seconds",
+            (("fault", fault), ("method", _metric_method(flow))),
+            seconds,
+        )
+
+    def render(self):
+        def fmt(labels):
+            return ",".join(f'{k}="{v}"' for k, v in labels)
+
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+
+        lines = []
+        for name, (kind, text) in self.HELP.items():
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (_name, labels), value in counters.items():
+                if _name == name:
+                    lines.append(f"{name}{{{fmt(labels)}}} {value}")
+            for (_name, labels), h in histograms.items():
+                if _name != name:
+                    continue
+                for bucket, count in zip(DELAY_BUCKETS, h):
+                    le = fmt(labels + (("le", bucket),))
+                    lines.append(f"{name}_bucket{{{le}}} {count}")
+                le = fmt(labels + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{{{le}}} {h[-1]}")
+                lines.append(f"{name}_sum{{{fmt(labels)}}} {h[-2]}")
+                lines.append(f"{name}_count{{{fmt(labels)}}} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = FaultMetrics()
+
+
+class FaultMetricsExporter:
+    DEFAULT_PORT = 9094
+
+    def __init__(self, port=None):
+        self.port = port or \
+            int(os.environ.get("MITM_METRICS_PORT", self.DEFAULT_PORT))
+        self.server = None
+
+    def running(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = METRICS.render().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("", self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True) \
+            .start()
+
+    def done(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def request(self, flow):
+        METRICS.flow(flow)
+
+
+# Fault schedules
+#
+# Every failure draws from its own random.Random, seeded with seed= for
+# reproducible runs. With schedule=FaultSchedule(path), each injected fault
+# is appended to path as a JSON line, and with
+# schedule=FaultSchedule(path, replay=True) the very same faults are applied
+# again: the n-th eligible flow of a given method gets a fault only if it got
+# one in the recorded run. Fault parameters (error codes, delays, corrupted
+# positions...) are drawn from a per fault seed that is recorded as well.
+
+class FaultSchedule:
+    def __init__(self, path, replay=False):
+        self.path = path
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.faults = {}
+        if replay:
+            with open(path) as f:
+                for line in f:
+                    r = json.loads(line)
+                    self.faults[(r["fault"], r["method"], r["n"])] = r["seed"]
+        else:
+            self.file = open(path, "a", buffering=1)
+
+    def next(self, fault, method):
+        with self.lock:
+            n = self.counters.get((fault, method), 0)
+            self.counters[(fault, method)] = n + 1
+        return n
+
+    def replayed(self, fault, method, n):
+        return self.faults.get((fault, method, n))
+
+    def record(self, flow, fault, method, n, seed):
+        line = json.dumps(
+            {
+                "n": n,
+                "flow": flow.id,
+                "fault": fault,
+                "method": method,
+                "peer": _peer_addr(flow),
+                "seed": seed,
+            },
+            separators=(",", ":"),
+        )
+        with self.lock:
+            self.file.write(line + "\n")
+
+
 class GenericFailure:
-    def __init__(self, ratio, selected_peers=[]):
+    def __init__(
+        self, ratio, selected_peers=[], selected_methods=[], seed=None,
+        schedule=None, name=None
+    ):
         self.ratio = ratio
         self.peers = selected_peers
+        self.methods = selected_methods
+        self.rng = Random(seed)
+        self.schedule = schedule
+        self.name = name or type(self).__name__
+        self.rng_key = f"failures.rng.{id(self)}"
 
     def _eligible_peer(self, flow):
-        _peer = flow.client_conn.peername
-        _peer_addr = _peer[0] if _peer else None
-        return (not self.peers) or (_peer_addr in self.peers)
+        return (not self.peers) or (_peer_addr(flow) in self.peers)
+
+    def _eligible_method(self, flow):
+        return (not self.methods) or (_request_method(flow) in self.methods)
 
-    def _random_select(self):
-        assert (0.0 <= self.ratio <= 1.0)
-        a = int(self.ratio * 100)
-        b = randint(0, 99)
+    # Methods FailureRouter indexes the failure under, None for any
+    def _route_methods(self):
+        return self.methods or [None]
 
-        if a > b:
+    def _eligible_flow(self, flow):
+        return self._eligible_peer(flow) and self._eligible_method(flow)
+
+    # Called once peer and method already matched, either by the hooks
+    # below or by FailureRouter
+    def _routed_request(self, flow):
+        pass
+
+    def _routed_response(self, flow):
+        pass
+
+    def _routed_responseheaders(self, flow):
+        pass
+
+    def _random_select(self, flow, ratio=None, method=None):
+        ratio = self.ratio if ratio is None else ratio
+        assert (0.0 <= ratio <= 1.0)
+        if self.schedule is None:
+            if not self.rng.random() < ratio:
+                return False
+            METRICS.injected(flow, self.name, method)
             return True
+
+        method = _request_method(flow) if method is None else method
+        n = self.schedule.next(self.name, method)
+        seed = flow.metadata.get(self.rng_key, (None, None))[0]
+        if self.schedule.replay:
+            seed = self.schedule.replayed(self.name, method, n)
+            if seed is None:
+                return False
         else:
-            return False
+            if not self.rng.random() < ratio:
+                return False
+            if seed is None:
+                seed = self.rng.getrandbits(32)
+            self.schedule.record(flow, self.name, method, n, seed)
+
+        if self.rng_key not in flow.metadata:
+            flow.metadata[self.rng_key] = (seed, Random(seed))
+        METRICS.injected(flow, self.name, method)
+        return True
+
+    def _fault_rng(self, flow):
+        """Random source for the parameters of the fault applied to flow"""
+        return flow.metadata.get(self.rng_key, (None, self.rng))[1]
 
     def _set_my_header(self, flow):
         flow.response.headers["mitm"] = "Intercepted"
@@ -36,20 +408,35 @@ class GenericResponseFailure(GenericFailure):
     def _eligible_response(self, flow):
         return True
 
-    @concurrent
-    def response(self, flow):
+    def _routed_response(self, flow):
         if not self._eligible_response(flow):
             return
 
-        if not self._eligible_peer(flow):
-            return
-
-        if not self._random_select():
+        if not self._random_select(flow):
             return
 
         self._set_my_header(flow)
         self._my_response(flow)
 
+    @concurrent
+    def response(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_response(flow)
+
+
+class JSONBodyFlush:
+    """
+    Writes back JSON bodies mutated by the addons before it. Add it last:
+        addons = [AddJSONFieldsResponse(0.5), ..., JSONBodyFlush()]
+    """
+    def requestheaders(self, flow):
+        flow.metadata[DEFER_FLUSH_KEY] = True
+
+    def response(self, flow):
+        _flush_json_body(flow)
+        # Addons after this one have to write back on their own
+        flow.metadata.pop(DEFER_FLUSH_KEY, None)
+
 
 class GenericRequestFailure(GenericFailure):
     def _my_request(self, flow):
@@ -58,18 +445,23 @@ class GenericRequestFailure(GenericFailure):
     def _eligible_request(self, flow):
         return True
 
-    @concurrent
-    def request(self, flow):
+    def _routed_request(self, flow):
         if not self._eligible_request(flow):
             return
 
-        if not self._eligible_peer(flow):
-            return
-
-        if not self._random_select():
+        if not self._random_select(flow):
             return
 
         self._my_request(flow)
+        if flow.response is not None:
+            METRICS.rewritten(
+                flow, self.name, len(flow.response.raw_content or b"")
+            )
+
+    @concurrent
+    def request(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_request(flow)
 
 
 # Error classes
@@ -78,13 +470,14 @@ class HttpErrorResponse(GenericRequestFailure):
     DEFAULT_ERROR_CODES = [401, 403, 404, 405, 429, 500, 502, 503, 504]
 
     def __init__(
-        self, ratio, selected_peers=[], error_codes=DEFAULT_ERROR_CODES
+        self, ratio, selected_peers=[], error_codes=DEFAULT_ERROR_CODES,
+        **kwargs
     ):
         self.error_codes = error_codes
-        super().__init__(ratio, selected_peers)
+        super().__init__(ratio, selected_peers, **kwargs)
 
     def _my_request(self, flow):
-        error_code = self.error_codes[randint(0, len(self.error_codes) - 1)]
+        error_code = self._fault_rng(flow).choice(self.error_codes)
         flow.response = \
             http.Response.make(
                 error_code,
@@ -134,33 +527,186 @@ class ArbitraryJSONResponse(GenericRequestFailure):
 
 
 class SlowResponse(GenericResponseFailure):
+    """
+    Delays responses without holding a worker thread: the response hook is
+    async, so any number of delayed flows can be in flight at once.
+
+    Supported distributions:
+    - fixed: always min_seconds
+    - uniform: between min_seconds and max_seconds
+    - normal: mean_seconds +/- stddev_seconds, never negative
+    - pareto: long tail starting at min_seconds with shape alpha,
+      capped at max_seconds
+    """
     RANDOM_MIN_SECONDS = 1
     RANDOM_MAX_SECONDS = 5
+    DISTRIBUTIONS = ["fixed", "uniform", "normal", "pareto"]
 
-    def _my_response(self, flow):
-        sleep(
-            randint(self.RANDOM_MIN_SECONDS, self.RANDOM_MAX_SECONDS)
+    def __init__(
+        self, ratio, selected_peers=[], distribution="uniform",
+        min_seconds=RANDOM_MIN_SECONDS, max_seconds=RANDOM_MAX_SECONDS,
+        mean_seconds=None, stddev_seconds=None, alpha=1.5, **kwargs
+    ):
+        assert distribution in self.DISTRIBUTIONS
+        assert 0 <= min_seconds <= max_seconds
+        self.distribution = distribution
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.mean_seconds = \
+            (min_seconds + max_seconds) / 2 \
+            if mean_seconds is None else mean_seconds
+        self.stddev_seconds = \
+            (max_seconds - min_seconds) / 4 \
+            if stddev_seconds is None else stddev_seconds
+        self.alpha = alpha
+        super().__init__(ratio, selected_peers, **kwargs)
+
+    def _delay(self, rng):
+        if self.distribution == "fixed":
+            return self.min_seconds
+        if self.distribution == "uniform":
+            return rng.uniform(self.min_seconds, self.max_seconds)
+        if self.distribution == "normal":
+            return max(0.0, rng.gauss(self.mean_seconds, self.stddev_seconds))
+        return min(
+            self.min_seconds * rng.paretovariate(self.alpha), self.max_seconds
         )
 
+    async def _routed_response(self, flow):
+        if not self._eligible_response(flow):
+            return
+
+        if not self._random_select(flow):
+            return
+
+        self._set_my_header(flow)
+        delay = self._delay(self._fault_rng(flow))
+        METRICS.delayed(flow, self.name, delay)
+        await asyncio.sleep(delay)
+
+    async def response(self, flow):
+        if self._eligible_flow(flow):
+            await self._routed_response(flow)
+
 
 class CorruptedJSONResponse(GenericResponseFailure):
     def _eligible_response(self, flow):
-        if flow.response.headers.get("Content-Type") == "application/json":
-            if len(flow.response.text) < 2:
-                return False
-            try:
-                body = json.loads(flow.response.text)
-                return (isinstance(body, dict) and body.get("result"))
-            except json.JSONDecodeError:
-                return False
-        else:
-            return False
+        return _json_result(flow) is not None
 
     def _my_response(self, flow):
+        # Byte level corruption, so pending JSON mutations go first
+        _flush_json_body(flow)
+        rng = self._fault_rng(flow)
         flow.response.text = \
-            flow.response.text[:randint(0, len(flow.response.text) - 1)] \
+            flow.response.text[:rng.randint(0, len(flow.response.text) - 1)] \
             + "0" \
-            + flow.response.text[randint(0, len(flow.response.text) - 1):]
+            + flow.response.text[rng.randint(0, len(flow.response.text) - 1):]
+        METRICS.rewritten(flow, self.name, len(flow.response.raw_content))
+
+
+class CorruptedBytesResponse(GenericResponseFailure):
+    """
+    Overwrites random bytes of JSON responses. The body is handled as bytes
+    in a bytearray, never decoded to text nor parsed, so large eth_getLogs
+    or debug_trace* answers cost a single extra copy.
+
+    With stream=True the body is not even buffered: the response is streamed
+    and the bytes are corrupted in each chunk as it goes through, so memory
+    stays flat whatever the payload size. Compression is disabled for the
+    selected peers in that mode, so it is the JSON that gets corrupted.
+    """
+    # Where to corrupt streamed bodies without a Content-Length
+    STREAM_WINDOW_BYTES = 4096
+
+    def __init__(
+        self, ratio, selected_peers=[], corrupted_bytes=1, stream=False,
+        **kwargs
+    ):
+        self.corrupted_bytes = corrupted_bytes
+        self.stream = stream
+        super().__init__(ratio, selected_peers, **kwargs)
+
+    def _eligible_response(self, flow):
+        return (
+            flow.response.headers.get("Content-Type", "")
+            .startswith("application/json")
+        )
+
+    def _corrupt(self, body, offset, positions):
+        for i in positions:
+            if offset <= i < offset + len(body):
+                body[i - offset] = \
+                    ord("1") if body[i - offset] == ord("0") else ord("0")
+
+    def _routed_request(self, flow):
+        if self.stream:
+            flow.request.headers.pop("Accept-Encoding", None)
+
+    def request(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_request(flow)
+
+    def _routed_responseheaders(self, flow):
+        if not self.stream or not self._eligible_response(flow):
+            return
+
+        length = flow.response.headers.get("Content-Length")
+        length = int(length) if length else self.STREAM_WINDOW_BYTES
+        if not length:
+            return
+
+        if not self._random_select(flow):
+            return
+
+        self._set_my_header(flow)
+        rng = self._fault_rng(flow)
+        positions = [
+            rng.randrange(length) for _ in range(self.corrupted_bytes)
+        ]
+        offset = 0
+        name = self.name
+
+        def corrupt_chunk(chunk):
+            nonlocal offset
+            if any(offset <= i < offset + len(chunk) for i in positions):
+                body = bytearray(chunk)
+                self._corrupt(body, offset, positions)
+                METRICS.rewritten(flow, name, len(chunk))
+                chunk = bytes(body)
+            offset += len(chunk)
+            return chunk
+
+        flow.response.stream = corrupt_chunk
+
+    def responseheaders(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_responseheaders(flow)
+
+    def _routed_response(self, flow):
+        # Streamed bodies were already handled chunk by chunk
+        if not self.stream:
+            super()._routed_response(flow)
+
+    def _my_response(self, flow):
+        if not flow.response.raw_content:
+            return
+
+        _flush_json_body(flow)
+        rng = self._fault_rng(flow)
+        encoded = "Content-Encoding" in flow.response.headers
+        body = bytearray(
+            flow.response.content if encoded else flow.response.raw_content
+        )
+        positions = [
+            rng.randrange(len(body)) for _ in range(self.corrupted_bytes)
+        ]
+        self._corrupt(body, 0, positions)
+        # Same length, so Content-Length is still right
+        if encoded:
+            flow.response.content = bytes(body)
+        else:
+            flow.response.raw_content = bytes(body)
+        METRICS.rewritten(flow, self.name, len(body))
 
 
 class NoResponse(GenericRequestFailure):
@@ -173,37 +719,242 @@ class AddJSONFieldsResponse(GenericResponseFailure):
     MAX_EXTRA_FIELDS = 5
 
     def _eligible_response(self, flow):
-        if flow.response.headers.get("Content-Type") == "application/json":
-            try:
-                body = json.loads(flow.response.text)
-                return (isinstance(body, dict) and body.get("result"))
-            except json.JSONDecodeError:
-                return False
-        else:
-            return False
+        return _json_result(flow) is not None
 
     def _my_response(self, flow):
-        body = json.loads(flow.response.text)
-        for _ in range(randint(self.MIN_EXTRA_FIELDS, self.MAX_EXTRA_FIELDS)):
-            if isinstance(body["result"], dict):
-                body["result"][f"new_field_{_}"] = f"new_value_{_}"
-            elif isinstance(body["result"], list):
-                body["result"].append({f"new_value_{_}": f"new_value_{_}"})
-        flow.response.text = json.dumps(body)
+        result = _json_result(flow)
+        rng = self._fault_rng(flow)
+        for _ in range(
+            rng.randint(self.MIN_EXTRA_FIELDS, self.MAX_EXTRA_FIELDS)
+        ):
+            if isinstance(result, dict):
+                result[f"new_field_{_}"] = f"new_value_{_}"
+            elif isinstance(result, list):
+                result.append({f"new_value_{_}": f"new_value_{_}"})
+        _mark_json_body_dirty(flow, self)
+
+
+def _split_url(url):
+    url = urlsplit(url)
+    port = url.port or (443 if url.scheme == "https" else 80)
+    return url.scheme, url.hostname, port
+
+
+def _redirect(flow, upstream):
+    scheme, host, port = upstream
+    flow.request.scheme = scheme
+    flow.request.host = host
+    flow.request.port = port
+    flow.request.headers["Host"] = host
 
 
 class RedirectRequest(GenericRequestFailure):
-    def __init__(self, ratio, selected_peers=[], redirect_url=None):
-        self.scheme = redirect_url.split("://")[0]
-        self.host = redirect_url.split("://")[1].split(":")[0]
-        self.port = int(redirect_url.split(":")[2])
-        super().__init__(ratio, selected_peers)
+    def __init__(self, ratio, selected_peers=[], redirect_url=None, **kwargs):
+        self.scheme, self.host, self.port = _split_url(redirect_url)
+        super().__init__(ratio, selected_peers, **kwargs)
 
     def _my_request(self, flow):
-        flow.request.scheme = self.scheme
-        flow.request.host = self.host
-        flow.request.port = self.port
-        flow.request.headers["Host"] = self.host
+        _redirect(flow, (self.scheme, self.host, self.port))
+
+
+class _ImmutableResponseCache:
+    """
+    TTL cache of JSON-RPC results that can't change: eth_chainId, blocks by
+    hash, and blocks and receipts at or below the finalized block, which is
+    tracked from the eth_getBlockByNumber("finalized") answers going through.
+    """
+    MAX_ENTRIES = 10000
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.finalized = -1
+
+    def _key(self, content):
+        if not isinstance(content, dict):
+            return None
+        method = content.get("method")
+        if method not in [
+            "eth_chainId", "eth_getBlockByHash", "eth_getBlockByNumber",
+            "eth_getTransactionReceipt",
+        ]:
+            return None
+        return (method, json.dumps(content.get("params") or []))
+
+    def _cacheable(self, method, params, result):
+        if result is None:
+            return False
+        if method in ["eth_chainId", "eth_getBlockByHash"]:
+            return True
+        if method == "eth_getBlockByNumber":
+            if params and params[0] == "finalized":
+                with self.lock:
+                    self.finalized = max(
+                        self.finalized, int(result["number"], 16)
+                    )
+                return False
+            # Tags like latest move, only blocks by number are immutable
+            if not (params and str(params[0]).startswith("0x")):
+                return False
+            number = result.get("number")
+        else:
+            number = result.get("blockNumber")
+        return number is not None and int(number, 16) <= self.finalized
+
+    def get(self, content):
+        key = self._key(content)
+        if key is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, content, body):
+        key = self._key(content)
+        if key is None or not isinstance(body, dict) or "error" in body:
+            return
+        result = body.get("result")
+        if not self._cacheable(key[0], content.get("params"), result):
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+
+class MultiUpstreamRedirect(GenericRequestFailure):
+    """
+    Spreads the selected requests over several upstreams, either round robin
+    or randomly by weight. Upstreams are health checked every
+    health_check_seconds with eth_chainId, and taken out as soon as a
+    connection to them fails, until their next successful check.
+
+    With cache_ttl_seconds, immutable results (see _ImmutableResponseCache)
+    are kept for that long and served by the proxy without any upstream call.
+    """
+    STRATEGIES = ["round_robin", "weighted"]
+    HEALTH_CHECK_TIMEOUT_SECONDS = 2
+
+    def __init__(
+        self, ratio, selected_peers=[], upstreams=[], weights=None,
+        strategy="round_robin", health_check_seconds=5,
+        cache_ttl_seconds=0, **kwargs
+    ):
+        assert strategy in self.STRATEGIES
+        assert upstreams
+        self.urls = upstreams
+        self.upstreams = [_split_url(url) for url in upstreams]
+        self.weights = weights or [1] * len(upstreams)
+        self.strategy = strategy
+        self.health_check_seconds = health_check_seconds
+        self.healthy = [True] * len(upstreams)
+        self.next = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.cache = \
+            _ImmutableResponseCache(cache_ttl_seconds) \
+            if cache_ttl_seconds else None
+        super().__init__(ratio, selected_peers, **kwargs)
+        self.metadata_key = f"failures.upstream.{id(self)}"
+
+    def _check(self, i):
+        request = urllib.request.Request(
+            self.urls[i],
+            data=json.dumps(
+                {"jsonrpc": "2.0", "id": 1, "method": "eth_chainId"}
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(
+                request, timeout=self.HEALTH_CHECK_TIMEOUT_SECONDS
+            ) as response:
+                return "result" in json.load(response)
+        except Exception:
+            return False
+
+    def _health_checks(self):
+        while not self.stopped.is_set():
+            for i in range(len(self.upstreams)):
+                healthy = self._check(i)
+                if healthy != self.healthy[i]:
+                    logging.warning(
+                        f"Upstream {self.urls[i]} is "
+                        + ("healthy" if healthy else "unhealthy")
+                    )
+                self.healthy[i] = healthy
+            self.stopped.wait(self.health_check_seconds)
+
+    def running(self):
+        if self.health_check_seconds:
+            threading.Thread(target=self._health_checks, daemon=True).start()
+
+    def done(self):
+        self.stopped.set()
+
+    def _select_upstream(self):
+        candidates = [
+            i for i in range(len(self.upstreams)) if self.healthy[i]
+        ]
+        if not candidates:
+            return None
+        if self.strategy == "weighted":
+            return self.rng.choices(
+                candidates, [self.weights[i] for i in candidates]
+            )[0]
+        with self.lock:
+            self.next += 1
+            return candidates[self.next % len(candidates)]
+
+    def _my_request(self, flow):
+        content = _json_request(flow)
+        if self.cache is not None:
+            result = self.cache.get(content)
+            if result is not None:
+                METRICS.inc(
+                    "mitm_cache_hits_total",
+                    (("method", content["method"]),),
+                )
+                flow.response = http.Response.make(
+                    200,
+                    json.dumps({
+                        "jsonrpc": "2.0",
+                        "id": content.get("id"),
+                        "result": result,
+                    }),
+                    {"Content-Type": "application/json"},
+                )
+                return
+
+        i = self._select_upstream()
+        if i is None:
+            return
+        flow.metadata[self.metadata_key] = (i, content)
+        _redirect(flow, self.upstreams[i])
+
+    def _routed_response(self, flow):
+        i, content = flow.metadata.get(self.metadata_key, (None, None))
+        if self.cache is not None and content is not None \
+                and flow.response.status_code == 200:
+            self.cache.put(content, _json_body(flow))
+
+    @concurrent
+    def response(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_response(flow)
+
+    def error(self, flow):
+        i, _ = flow.metadata.get(self.metadata_key, (None, None))
+        if i is not None:
+            self.healthy[i] = False
 
 
 class InvalidJSONResponse(GenericRequestFailure):
@@ -221,31 +972,22 @@ class RemoveJSONFieldsResponse(GenericResponseFailure):
     MAX_REMOVED_FIELDS = 3
 
     def _eligible_response(self, flow):
-        if flow.response.headers.get("Content-Type") == "application/json":
-            try:
-                body = json.loads(flow.response.text)
-                return (
-                    isinstance(body, dict) and
-                    body.get("result") and
-                    isinstance(body["result"], dict) and
-                    (len(body["result"]) >= self.MAX_REMOVED_FIELDS)
-                )
-            except json.JSONDecodeError:
-                return False
-        else:
-            return False
+        result = _json_result(flow)
+        return (
+            isinstance(result, dict) and
+            (len(result) >= self.MAX_REMOVED_FIELDS)
+        )
 
     def _my_response(self, flow):
-        body = json.loads(flow.response.text)
+        result = _json_result(flow)
+        rng = self._fault_rng(flow)
         for _ in range(
-            randint(self.MIN_REMOVED_FIELDS, self.MAX_REMOVED_FIELDS)
+            rng.randint(self.MIN_REMOVED_FIELDS, self.MAX_REMOVED_FIELDS)
         ):
-            key = list(body["result"].keys())[
-                randint(0, len(body["result"]) - 1)
-            ]
-            del body["result"][key]
+            key = list(result.keys())[rng.randint(0, len(result) - 1)]
+            del result[key]
 
-        flow.response.text = json.dumps(body)
+        _mark_json_body_dirty(flow, self)
 
 
 class WrongContentTypeResponse(GenericResponseFailure):
@@ -265,48 +1007,900 @@ class WrongContentLengthResponse(GenericResponseFailure):
             flow.response.headers["Content-Length"] = "1099511627776"
 
 
-# class OlderLatestBlock(GenericResponseFailure, GenericRequestFailure):
-#     BLOCK_DIFF = 20
-
-#     def __init__(self, ratio):
-#         self.fids = []
-#         super().__init__(ratio)
-
-#     def _eligible_request(self, flow):
-#         content = json.loads(flow.request.content)
-#         print(f"Content: {content}")
-#         eligible = (
-#             (flow.request.headers.get("Content-Type") == "application/json")
-#             and isinstance(content, dict)
-#             and (
-#                 content.get("method") == "eth_blockNumber"
-#                 or (
-#                     content.get("method") == "eth_getBlockByNumber"
-#                     and any(
-#                         x in content.get("params", [])
-#                         for x in ["finalized", "safe", "latest"]
-#                     )
-#                 )
-#             )
-#         )
-#         print(f"Eligible request: {eligible}")
-#         return eligible
-
-#     def _my_request(self, flow):
-#         content = json.loads(flow.request.content)
-#         if content.get("method") == "eth_getBlockByNumber":
-#             # let's query the server here
-            
-#         else:
-#             self.fids.append(flow.id)
-
-#     def _eligible_response(self, flow):
-#         return flow.id in self.fids
-
-#     def _my_response(self, flow):
-#         self.fids.remove(flow.id)
-#         body = json.loads(flow.response.text)
-#         print(f"Old block: {body['result']}")
-#         body["result"] = hex(int(body["result"], 16) - self.BLOCK_DIFF)
-#         print(f"New block: {body['result']}")
-#         flow.response.text = json.dumps(body)
+# Throughput classes
+#
+# Throttled L1 providers, modelled with token buckets holding up to burst
+# tokens and refilled at rate tokens per second. Rate limits take whole
+# tokens and reject requests when there is none left, while bandwidth
+# shaping reserves tokens ahead and waits for them, so every flow drawing
+# from the same bucket shares its rate.
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.last) * self.rate
+        )
+        self.last = now
+
+    def take(self):
+        """Return 0 if a token was taken, else the seconds until one is"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def reserve(self, tokens):
+        """Take tokens, even ahead, and return the seconds to wait for them"""
+        with self.lock:
+            self._refill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+
+class _PeerBuckets:
+    """One token bucket per peer, or a single shared one"""
+    def __init__(self, rate, burst, per_peer=True):
+        assert rate > 0 and burst >= 1
+        self.rate = rate
+        self.burst = burst
+        self.per_peer = per_peer
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get(self, peer):
+        key = peer if self.per_peer else None
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = \
+                    _TokenBucket(self.rate, self.burst)
+            return bucket
+
+
+class RateLimitResponse(GenericRequestFailure):
+    """
+    Emulates a provider with a budget of requests_per_second per peer (or
+    shared by all of them with per_peer=False), allowing bursts of up to
+    burst requests. That ratio of the requests over budget get a 429 with a
+    Retry-After header and a JSON-RPC limit exceeded error, so 1.0 behaves
+    like a strict provider. Rejected requests don't consume the budget.
+    """
+    ERROR_CODE = -32005
+
+    def __init__(
+        self, ratio, selected_peers=[], requests_per_second=10, burst=None,
+        per_peer=True, **kwargs
+    ):
+        self.buckets = _PeerBuckets(
+            requests_per_second, burst or requests_per_second, per_peer
+        )
+        super().__init__(ratio, selected_peers, **kwargs)
+        self.metadata_key = f"failures.rate_limit.{id(self)}"
+
+    def _eligible_request(self, flow):
+        wait = self.buckets.get(_peer_addr(flow)).take()
+        if not wait:
+            return False
+        flow.metadata[self.metadata_key] = wait
+        return True
+
+    def _my_request(self, flow):
+        content = _json_request(flow)
+        retry_after = max(1, math.ceil(flow.metadata[self.metadata_key]))
+        flow.response = \
+            http.Response.make(
+                429,
+                json.dumps({
+                    "jsonrpc": "2.0",
+                    "id":
+                        content.get("id") if isinstance(content, dict)
+                        else None,
+                    "error": {
+                        "code": self.ERROR_CODE,
+                        "message": "Request rate exceeded",
+                    },
+                }),
+                {
+                    "Content-Type": "application/json",
+                    "Retry-After": str(retry_after),
+                }
+            )
+
+
+class _ThrottlingRelay:
+    """
+    Local HTTP server the throttled flows are redirected to. It forwards
+    them to their real upstream, given in UPSTREAM_HEADER, and writes the
+    answer back in chunks paced by the failure. Waits happen in the relay
+    threads: mitmproxy streams the chunks to the client as they come, and its
+    event loop is never blocked.
+    """
+    UPSTREAM_HEADER = "X-Mitm-Upstream"
+    PEER_HEADER = "X-Mitm-Peer"
+    TIMEOUT_SECONDS = 60
+    HOP_HEADERS = [
+        "connection", "keep-alive", "proxy-connection", "transfer-encoding",
+        "host", "te", "upgrade",
+    ]
+
+    def __init__(self, failure):
+        relay = self
+        self.failure = failure
+        self.stopped = threading.Event()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                relay._relay(self)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.upstream = ("http", "127.0.0.1", self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True) \
+            .start()
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _relay(self, handler):
+        headers = {
+            k: v for k, v in handler.headers.items()
+            if k.lower() not in self.HOP_HEADERS
+            and k not in [self.UPSTREAM_HEADER, self.PEER_HEADER]
+        }
+        length = int(handler.headers.get("Content-Length") or 0)
+        request = urllib.request.Request(
+            handler.headers[self.UPSTREAM_HEADER] + handler.path,
+            data=handler.rfile.read(length) if length else None,
+            headers=headers,
+            method=handler.command,
+        )
+        try:
+            response = urllib.request.urlopen(
+                request, timeout=self.TIMEOUT_SECONDS
+            )
+        except urllib.error.HTTPError as e:
+            response = e
+        except Exception as e:
+            handler.send_error(502, str(e))
+            return
+
+        with response:
+            handler.send_response(response.status)
+            for k, v in response.headers.items():
+                if k.lower() not in self.HOP_HEADERS:
+                    handler.send_header(k, v)
+            handler.end_headers()
+            # Without Content-Length, the body ends with the connection
+            pace = self.failure._pacer(handler.headers[self.PEER_HEADER])
+            try:
+                while True:
+                    chunk = response.read(self.failure.chunk_bytes)
+                    if not chunk:
+                        break
+                    if self.stopped.wait(pace(len(chunk))):
+                        break
+                    handler.wfile.write(chunk)
+                    handler.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up waiting
+                pass
+
+
+class GenericThrottledResponse(GenericRequestFailure):
+    """
+    Sends the selected flows through a _ThrottlingRelay, which writes their
+    response body in chunk_bytes chunks, waiting before each chunk for the
+    time returned by the pacer from _pacer(peer).
+    """
+    def __init__(self, ratio, selected_peers=[], chunk_bytes=1, **kwargs):
+        assert chunk_bytes >= 1
+        self.chunk_bytes = chunk_bytes
+        self.relay = None
+        super().__init__(ratio, selected_peers, **kwargs)
+        self.metadata_key = f"failures.throttled.{id(self)}"
+
+    def _pacer(self, peer):
+        return lambda size: 0
+
+    def running(self):
+        self.relay = _ThrottlingRelay(self)
+
+    def done(self):
+        if self.relay:
+            self.relay.stop()
+            self.relay = None
+
+    def _eligible_request(self, flow):
+        return self.relay is not None
+
+    def _my_request(self, flow):
+        request = flow.request
+        request.headers[_ThrottlingRelay.UPSTREAM_HEADER] = \
+            f"{request.scheme}://{request.host}:{request.port}"
+        request.headers[_ThrottlingRelay.PEER_HEADER] = \
+            str(_peer_addr(flow))
+        flow.metadata[self.metadata_key] = True
+        _redirect(flow, self.relay.upstream)
+
+    def _routed_responseheaders(self, flow):
+        if flow.metadata.get(self.metadata_key):
+            # Forward the chunks as the relay writes them
+            flow.response.stream = True
+
+    def responseheaders(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_responseheaders(flow)
+
+    def _routed_response(self, flow):
+        if flow.metadata.get(self.metadata_key):
+            self._set_my_header(flow)
+            METRICS.delayed(
+                flow,
+                self.name,
+                flow.response.timestamp_end - flow.response.timestamp_start,
+            )
+
+    def response(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_response(flow)
+
+
+class BandwidthLimitResponse(GenericThrottledResponse):
+    """
+    Shapes the selected responses to bytes_per_second per peer (or shared by
+    all of them with per_peer=False), allowing bursts of up to burst_bytes.
+    Concurrent responses to the same peer share its bandwidth, like they
+    would behind a throttled link.
+    """
+    def __init__(
+        self, ratio, selected_peers=[], bytes_per_second=100_000,
+        burst_bytes=None, per_peer=True, chunk_bytes=None, **kwargs
+    ):
+        self.buckets = _PeerBuckets(
+            bytes_per_second, burst_bytes or bytes_per_second, per_peer
+        )
+        # Ten writes per second by default, so the rate looks smooth
+        chunk_bytes = chunk_bytes or max(1, bytes_per_second // 10)
+        super().__init__(ratio, selected_peers, chunk_bytes, **kwargs)
+
+    def _pacer(self, peer):
+        return self.buckets.get(peer).reserve
+
+
+class SlowDripResponse(GenericThrottledResponse):
+    """
+    Trickles the selected responses, chunk_bytes every interval_seconds,
+    like a stalled connection that keeps sending just enough bytes not to
+    time out. Each response drips on its own, whatever the peer's traffic.
+    """
+    def __init__(
+        self, ratio, selected_peers=[], chunk_bytes=16, interval_seconds=0.1,
+        **kwargs
+    ):
+        self.interval_seconds = interval_seconds
+        super().__init__(ratio, selected_peers, chunk_bytes, **kwargs)
+
+    def _pacer(self, peer):
+        return lambda size: self.interval_seconds
+
+
+# Batch classes
+#
+# JSON-RPC batches are parsed once and each element is selected on its own,
+# using method_ratios[method] if given, else ratio. Only the selected
+# elements are failed, the rest of the batch goes through untouched.
+
+class GenericBatchFailure(GenericFailure):
+    def __init__(self, ratio, selected_peers=[], method_ratios={}, **kwargs):
+        self.method_ratios = method_ratios
+        self.metadata_key = f"failures.batch.{id(self)}"
+        super().__init__(ratio, selected_peers, **kwargs)
+
+    def _my_batch_request(self, flow, batch, selected):
+        pass
+
+    def _my_batch_response(self, flow, batch, selected):
+        pass
+
+    def _select_elements(self, flow, batch):
+        return {
+            element["id"] for element in batch
+            if isinstance(element, dict)
+            and element.get("id") is not None
+            and self._random_select(
+                flow,
+                self.method_ratios.get(element.get("method"), self.ratio),
+                element.get("method"),
+            )
+        }
+
+    def _selected_elements(self, flow):
+        selected = flow.metadata.get(self.metadata_key)
+        batch = _json_body(flow)
+        if not selected or not isinstance(batch, list):
+            return None, None
+        return batch, selected
+
+    def _routed_request(self, flow):
+        batch = _json_request(flow)
+        if not isinstance(batch, list):
+            return
+
+        selected = self._select_elements(flow, batch)
+        if not selected:
+            return
+
+        flow.metadata[self.metadata_key] = selected
+        self._my_batch_request(flow, batch, selected)
+
+    def _routed_response(self, flow):
+        batch, selected = self._selected_elements(flow)
+        if not selected:
+            return
+
+        self._set_my_header(flow)
+        self._my_batch_response(flow, batch, selected)
+        _mark_json_body_dirty(flow, self)
+
+    # Batches mix methods, so they are selected per element by
+    # method_ratios and never filtered by selected_methods
+    def _eligible_method(self, flow):
+        return True
+
+    # Batch flows have no method of their own
+    def _route_methods(self):
+        return [None]
+
+    @concurrent
+    def request(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_request(flow)
+
+    @concurrent
+    def response(self, flow):
+        if self._eligible_flow(flow):
+            self._routed_response(flow)
+
+
+class BatchErrorResponse(GenericBatchFailure):
+    """
+    Selected elements are not forwarded upstream, they get a JSON-RPC error
+    object instead, in their original position within the batch.
+    """
+    DEFAULT_ERROR_CODES = [-32000, -32005, -32603]
+
+    def __init__(
+        self, ratio, selected_peers=[], method_ratios={},
+        error_codes=DEFAULT_ERROR_CODES, **kwargs
+    ):
+        self.error_codes = error_codes
+        super().__init__(ratio, selected_peers, method_ratios, **kwargs)
+
+    def _my_batch_request(self, flow, batch, selected):
+        flow.metadata[self.metadata_key + ".order"] = [
+            element.get("id") if isinstance(element, dict) else None
+            for element in batch
+        ]
+        remaining = [
+            element for element in batch
+            if not isinstance(element, dict)
+            or element.get("id") not in selected
+        ]
+        if remaining:
+            flow.request.text = json.dumps(remaining)
+        else:
+            # Nothing left to forward, answer the whole batch locally
+            flow.response = http.Response.make(
+                200, "[]", {"Content-Type": "application/json"}
+            )
+
+    def _my_batch_response(self, flow, batch, selected):
+        rng = self._fault_rng(flow)
+        order = flow.metadata[self.metadata_key + ".order"]
+        for _id in order:
+            if _id not in selected:
+                continue
+            error_code = rng.choice(self.error_codes)
+            batch.append({
+                "jsonrpc": "2.0",
+                "id": _id,
+                "error": {"code": error_code, "message": "mitm batch error"},
+            })
+
+        position = {_id: i for i, _id in enumerate(order)}
+        batch.sort(
+            key=lambda element: position.get(
+                element.get("id") if isinstance(element, dict) else None,
+                len(order)
+            )
+        )
+
+
+class BatchNullResultResponse(GenericBatchFailure):
+    def _my_batch_response(self, flow, batch, selected):
+        for element in batch:
+            if isinstance(element, dict) and element.get("id") in selected:
+                element["result"] = None
+
+
+class BatchMissingElementResponse(GenericBatchFailure):
+    def _my_batch_response(self, flow, batch, selected):
+        batch[:] = [
+            element for element in batch
+            if not isinstance(element, dict)
+            or element.get("id") not in selected
+        ]
+
+
+class BatchCorruptedResponse(GenericBatchFailure):
+    """
+    Corrupts the result of selected elements: a hex digit is changed in
+    strings, a key is dropped from objects and an entry from lists.
+    """
+    def _corrupt(self, rng, result):
+        if isinstance(result, str) and len(result) > 2:
+            i = rng.randint(2, len(result) - 1)
+            digit = "1" if result[i] == "0" else "0"
+            return result[:i] + digit + result[i + 1:]
+        if isinstance(result, dict) and result:
+            del result[list(result.keys())[rng.randint(0, len(result) - 1)]]
+        elif isinstance(result, list) and result:
+            del result[rng.randint(0, len(result) - 1)]
+        return result
+
+    def _my_batch_response(self, flow, batch, selected):
+        rng = self._fault_rng(flow)
+        for element in batch:
+            if isinstance(element, dict) and element.get("id") in selected:
+                element["result"] = self._corrupt(rng, element.get("result"))
+
+
+class BatchSlowResponse(GenericBatchFailure):
+    """
+    A batch response can only be sent as a whole, so it is delayed by the
+    longest of the delays drawn for its selected elements.
+    """
+    RANDOM_MIN_SECONDS = 1
+    RANDOM_MAX_SECONDS = 5
+
+    async def _routed_response(self, flow):
+        selected = flow.metadata.get(self.metadata_key)
+        if not selected:
+            return
+
+        self._set_my_header(flow)
+        rng = self._fault_rng(flow)
+        delay = max(
+            rng.uniform(self.RANDOM_MIN_SECONDS, self.RANDOM_MAX_SECONDS)
+            for _ in selected
+        )
+        METRICS.delayed(flow, self.name, delay)
+        await asyncio.sleep(delay)
+
+    async def response(self, flow):
+        if self._eligible_flow(flow):
+            await self._routed_response(flow)
+
+
+# Chain view classes
+#
+# LaggedChainView serves selected peers a consistent view of L1 that lags
+# the real one. The real latest, safe and finalized blocks are tracked from
+# the responses going through the proxy, from any peer, so it never makes
+# extra upstream requests: a lagged eth_getBlockByNumber is forwarded as a
+# batch of the original call, to keep tracking the real tag, and the call
+# for the matching lagged block number, whose answer is the one returned.
+# eth_blockNumber answers are lowered on their way back. As it must see
+# every peer's traffic to track the head, it filters selected_peers itself.
+
+class LaggedChainView(GenericFailure):
+    METHODS = ["eth_blockNumber", "eth_getBlockByNumber"]
+    TAGS = ["latest", "safe", "finalized"]
+    # Id of the call tracking the real tag in a rewritten request
+    HEAD_ID = "lagged-chain-view-head"
+
+    def __init__(
+        self, ratio, selected_peers=[], lag_blocks=10,
+        finality_lag_blocks=None, **kwargs
+    ):
+        if finality_lag_blocks is None:
+            finality_lag_blocks = lag_blocks
+        self.lags = {
+            "latest": lag_blocks,
+            "safe": finality_lag_blocks,
+            "finalized": finality_lag_blocks,
+        }
+        self.lagged_peers = selected_peers
+        self.heads = {}
+        self.lock = threading.Lock()
+        self.metadata_key = f"failures.chain.{id(self)}"
+        kwargs["selected_methods"] = self.METHODS
+        super().__init__(ratio, [], **kwargs)
+
+    def _learn(self, tag, number):
+        with self.lock:
+            if number > self.heads.get(tag, -1):
+                self.heads[tag] = number
+
+    def _lagged(self, tag):
+        with self.lock:
+            heads = dict(self.heads)
+        if tag not in heads:
+            return None
+        number = max(0, heads[tag] - self.lags[tag])
+        # A lagged safe or finalized block is never ahead of lagged latest
+        if tag != "latest" and "latest" in heads:
+            number = min(
+                number, max(0, heads["latest"] - self.lags["latest"])
+            )
+        return number
+
+    def _routed_request(self, flow):
+        content = _json_request(flow)
+        method = content.get("method")
+        params = content.get("params") or []
+        tag = params[0] if method == "eth_getBlockByNumber" and params \
+            else "latest"
+
+        lagged = (
+            (not self.lagged_peers or _peer_addr(flow) in self.lagged_peers)
+            and (method == "eth_blockNumber" or tag in self.TAGS)
+            and self._random_select(flow)
+        )
+        rewritten = False
+        if lagged and method == "eth_getBlockByNumber":
+            number = self._lagged(tag)
+            if number is not None:
+                flow.request.text = json.dumps([
+                    dict(content, id=self.HEAD_ID),
+                    dict(content, params=[hex(number)] + params[1:]),
+                ])
+                rewritten = True
+        flow.metadata[self.metadata_key] = (method, tag, lagged, rewritten)
+
+    def _learn_block(self, tag, result):
+        if not isinstance(result, dict) or "number" not in result:
+            return
+        number = int(result["number"], 16)
+        if tag in self.TAGS:
+            self._learn(tag, number)
+        elif tag.startswith("0x"):
+            # A block fetched by number is, at least, the latest one
+            self._learn("latest", number)
+
+    def _routed_response(self, flow):
+        method, tag, lagged, rewritten = \
+            flow.metadata.get(self.metadata_key, (None, None, False, False))
+        body = _json_body(flow)
+        if rewritten and isinstance(body, list):
+            head = next((
+                r for r in body
+                if isinstance(r, dict) and r.get("id") == self.HEAD_ID
+            ), {})
+            self._learn_block(tag, head.get("result"))
+            # Answer with the lagged block only
+            flow.metadata[JSON_BODY_KEY].value = body = next((
+                r for r in body
+                if isinstance(r, dict) and r.get("id") != self.HEAD_ID
+            ), {})
+            _mark_json_body_dirty(flow, self)
+        result = body.get("result") if isinstance(body, dict) else None
+        if not result:
+            return
+
+        if method == "eth_blockNumber":
+            self._learn("latest", int(result, 16))
+        elif not rewritten and isinstance(tag, str):
+            self._learn_block(tag, result)
+
+        if lagged:
+            self._set_my_header(flow)
+        if lagged and method == "eth_blockNumber":
+            body["result"] = hex(self._lagged("latest"))
+            _mark_json_body_dirty(flow, self)
+
+    @concurrent
+    def request(self, flow):
+        if self._eligible_method(flow):
+            self._routed_request(flow)
+
+    @concurrent
+    def response(self, flow):
+        # The request may have been rewritten into a batch since
+        if self.metadata_key in flow.metadata:
+            self._routed_response(flow)
+
+
+# Routing
+#
+# With many failures loaded, registering each of them as an addon means
+# every flow walks every failure's hooks. FailureRouter is registered
+# instead of them: it indexes the failures by (method, peer) once, and each
+# flow then does a single dict lookup to get the failures that apply to it.
+#
+#     addons = [
+#         FailureRouter([
+#             HttpErrorResponse(0.1, selected_methods=["eth_getLogs"]),
+#             SlowResponse(0.2, ["10.0.0.5"]),
+#         ]),
+#         JSONBodyFlush(),
+#     ]
+
+class FailureRouter:
+    def __init__(self, failures):
+        self.failures = failures
+        self.route_key = f"failures.route.{id(self)}"
+        self.index = {}
+        for failure in failures:
+            for method in failure._route_methods():
+                for peer in failure.peers or [None]:
+                    self.index.setdefault((method, peer), []).append(failure)
+        # Resolved (method, peer) routes, wildcards included
+        self.routes = {}
+
+    def _resolve(self, key):
+        method, peer = key
+        matches = set()
+        for k in [(method, peer), (method, None), (None, peer), (None, None)]:
+            matches.update(self.index.get(k, []))
+        # Keep the order in which the failures were given
+        route = (
+            tuple(f for f in self.failures if f in matches),
+            tuple(
+                asyncio.iscoroutinefunction(f._routed_response)
+                for f in self.failures if f in matches
+            ),
+        )
+        self.routes[key] = route
+        return route
+
+    def _route(self, flow):
+        route = flow.metadata.get(self.route_key)
+        if route is None:
+            key = (_request_method(flow), _peer_addr(flow))
+            route = self.routes.get(key) or self._resolve(key)
+            flow.metadata[self.route_key] = route
+        return route
+
+    def running(self):
+        for failure in self.failures:
+            if hasattr(failure, "running"):
+                failure.running()
+
+    def done(self):
+        for failure in self.failures:
+            if hasattr(failure, "done"):
+                failure.done()
+
+    def error(self, flow):
+        for failure in self._route(flow)[0]:
+            if hasattr(failure, "error"):
+                failure.error(flow)
+
+    def responseheaders(self, flow):
+        for failure in self._route(flow)[0]:
+            failure._routed_responseheaders(flow)
+
+    @concurrent
+    def request(self, flow):
+        for failure in self._route(flow)[0]:
+            # Once a failure answered or killed the flow, stop there
+            if flow.response is not None or flow.error is not None:
+                return
+            failure._routed_request(flow)
+
+    def _routed_responses(self, flow, failures):
+        for failure in failures:
+            failure._routed_response(flow)
+
+    async def response(self, flow):
+        failures, is_async = self._route(flow)
+        if not failures:
+            return
+
+        deferred = flow.metadata.get(DEFER_FLUSH_KEY, False)
+        flow.metadata[DEFER_FLUSH_KEY] = True
+        pending = []
+        for failure, _async in zip(failures, is_async):
+            if not _async:
+                pending.append(failure)
+                continue
+            # Run the synchronous ones in a single worker thread hop
+            if pending:
+                await asyncio.to_thread(self._routed_responses, flow, pending)
+                pending = []
+            await failure._routed_response(flow)
+
+        if pending:
+            await asyncio.to_thread(self._routed_responses, flow, pending)
+
+        # Unless a JSONBodyFlush still has to run, write back now
+        if not deferred:
+            del flow.metadata[DEFER_FLUSH_KEY]
+            _flush_json_body(flow)
+
+
+# Campaigns
+#
+# FaultCampaign reads the failures to run from a YAML or JSON file and
+# reloads it whenever it changes, without restarting mitmdump, so a running
+# devnet can be walked through a sequence of faults. Flows already in flight
+# finish with the failures they started with.
+#
+#     failures:
+#       - class: HttpErrorResponse
+#         ratio: 0.1
+#         peers: ["172.16.0.10"]
+#         methods: ["eth_getLogs"]
+#         # Active windows, in seconds since the file was (re)loaded
+#         windows: [[0, 60], [120, 180]]
+#         # Any other constructor argument
+#         args:
+#           error_codes: [429, 503]
+#       - class: SlowResponse
+#         ratio: 0.2
+#         args:
+#           distribution: pareto
+
+class _CampaignGeneration:
+    """
+    A loaded campaign, with the flows still running through its failures.
+    Once replaced, its failures are stopped as soon as those flows are done.
+    """
+    def __init__(self, campaign, loaded_at):
+        self.campaign = campaign
+        self.loaded_at = loaded_at
+        self.active = None
+        self.router = FailureRouter([])
+        self.flows = 0
+        self.retired = False
+        self.stopped = False
+
+    def router_at(self, now):
+        elapsed = now - self.loaded_at
+        active = tuple(
+            failure for failure, windows in self.campaign
+            if not windows
+            or any(start <= elapsed < end for start, end in windows)
+        )
+        if active != self.active:
+            self.active = active
+            self.router = FailureRouter(list(active))
+        return self.router
+
+    def stop(self):
+        # Failures with their own lifecycle, like health checks and relays.
+        # Stopping may block, so it never runs on the event loop.
+        if self.stopped:
+            return
+        self.stopped = True
+        router = FailureRouter([f for f, _ in self.campaign])
+        threading.Thread(target=router.done, daemon=True).start()
+
+
+class FaultCampaign:
+    RELOAD_INTERVAL_SECONDS = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.key = f"failures.campaign.{id(self)}"
+        self.file_id = None
+        self.lock = threading.Lock()
+        self.generation = _CampaignGeneration([], time.monotonic())
+        self.stopped = threading.Event()
+
+    def _load(self):
+        with open(self.path) as f:
+            if self.path.endswith(".json"):
+                config = json.load(f)
+            else:
+                from ruamel.yaml import YAML  # mitmproxy dependency
+                config = YAML(typ="safe").load(f)
+
+        campaign = []
+        for entry in (config or {}).get("failures") or []:
+            cls = globals().get(entry["class"])
+            if not (
+                isinstance(cls, type) and issubclass(cls, GenericFailure)
+            ):
+                raise ValueError(f"Unknown failure class {entry['class']}")
+            failure = cls(
+                entry.get("ratio", 1.0),
+                entry.get("peers", []),
+                selected_methods=entry.get("methods", []),
+                **entry.get("args", {}),
+            )
+            campaign.append((failure, entry.get("windows")))
+        return campaign
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+            file_id = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_id = None
+        if file_id == self.file_id:
+            return
+
+        try:
+            campaign = self._load() if file_id else []
+        except Exception as e:
+            # Keep the previous campaign, retry on the next check
+            logging.error(f"Invalid fault campaign {self.path}: {e}")
+            return
+        FailureRouter([f for f, _ in campaign]).running()
+        generation = _CampaignGeneration(campaign, time.monotonic())
+        with self.lock:
+            retired, self.generation = self.generation, generation
+            retired.retired = True
+            drained = retired.flows == 0
+        if drained:
+            retired.stop()
+        self.file_id = file_id
+        logging.info(f"Loaded fault campaign {self.path}")
+
+    # Reloads happen in their own thread, so file I/O, parsing and starting
+    # or stopping failures never block the proxy
+    def _reload(self):
+        while not self.stopped.wait(self.RELOAD_INTERVAL_SECONDS):
+            self._refresh()
+
+    def running(self):
+        self._refresh()
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def done(self):
+        self.stopped.set()
+        with self.lock:
+            self.generation.retired = True
+        self.generation.stop()
+
+    def _release(self, flow):
+        generation = flow.metadata.pop(self.key + ".generation", None)
+        if generation is None:
+            return
+        with self.lock:
+            generation.flows -= 1
+            drained = generation.retired and generation.flows == 0
+        if drained:
+            generation.stop()
+
+    def error(self, flow):
+        router = flow.metadata.get(self.key, self.generation.router)
+        router.error(flow)
+        self._release(flow)
+
+    async def request(self, flow):
+        with self.lock:
+            generation = self.generation
+            generation.flows += 1
+        router = generation.router_at(time.monotonic())
+        flow.metadata[self.key] = router
+        flow.metadata[self.key + ".generation"] = generation
+        await router.request(flow)
+
+    def responseheaders(self, flow):
+        router = flow.metadata.get(self.key, self.generation.router)
+        router.responseheaders(flow)
+
+    async def response(self, flow):
+        router = flow.metadata.get(self.key, self.generation.router)
+        await router.response(flow)
+        self._release(flow)
@@ -0,0 +1,3 @@
+import failures
+
+addons = [failures.FaultMetricsExporter()]
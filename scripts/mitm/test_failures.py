@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Tests for the failures.py mitm addons, driven with mitmproxy's test helpers
+against a fake JSON-RPC upstream.
+
+Run them, from an environment with mitmproxy installed, with:
+    python3 -m unittest discover scripts/mitm
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# The hooks must be registered before failures.py uses @concurrent
+import mitmproxy.proxy.layers.http as layers
+from mitmproxy.http import Response
+from mitmproxy.test import taddons, tflow
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import failures  # noqa: E402
+
+PEER = "10.0.0.5"
+OTHER_PEER = "10.0.0.6"
+
+
+class FakeNode:
+    """JSON-RPC upstream with a chain head, answering single and batch calls"""
+    def __init__(self, head=100):
+        self.head = head
+        self.requests = []
+
+    def _answer(self, call):
+        method, params = call.get("method"), call.get("params") or []
+        if method == "eth_blockNumber":
+            result = hex(self.head)
+        elif method == "eth_getBlockByNumber":
+            tag = params[0]
+            number = self.head if tag in ["latest", "safe", "finalized"] \
+                else int(tag, 16)
+            result = {"number": hex(number), "hash": "0x" + "ab" * 32}
+        else:
+            result = {"method": method}
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": result}
+
+    def respond(self, flow):
+        request = json.loads(flow.request.content)
+        self.requests.append(request)
+        if isinstance(request, list):
+            body = [self._answer(call) for call in request]
+        else:
+            body = self._answer(request)
+        flow.response = Response.make(
+            200, json.dumps(body), {"Content-Type": "application/json"}
+        )
+
+
+def call(method, params=None, id=1):
+    return {"jsonrpc": "2.0", "id": id, "method": method,
+            "params": params or []}
+
+
+def make_flow(request, peer=PEER):
+    flow = tflow.tflow()
+    flow.client_conn.peername = (peer, 40000)
+    flow.request.headers["Content-Type"] = "application/json"
+    flow.request.text = json.dumps(request)
+    return flow
+
+
+async def run_flow(tctx, flow, node):
+    """Run a flow through the loaded addons, as mitmdump would"""
+    for hook in [layers.HttpRequestHeadersHook, layers.HttpRequestHook]:
+        await tctx.master.addons.handle_lifecycle(hook(flow))
+    if flow.response is None:
+        node.respond(flow)
+    await tctx.master.addons.handle_lifecycle(layers.HttpResponseHook(flow))
+    return flow
+
+
+def run_flows(addons, requests, node=None, peer=PEER):
+    """Run the requests through the addons, returning their flows"""
+    node = node or FakeNode()
+
+    async def run():
+        with taddons.context() as tctx:
+            tctx.master.addons.add(*addons)
+            return [
+                await run_flow(tctx, make_flow(request, peer), node)
+                for request in requests
+            ]
+    return asyncio.run(run())
+
+
+def body(flow):
+    return json.loads(flow.response.content)
+
+
+class FailureRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.logs = failures.HttpErrorResponse(
+            1.0, [PEER], selected_methods=["eth_getLogs"], error_codes=[503]
+        )
+        self.calls = failures.EmptyJSONResponse(
+            1.0, selected_methods=["eth_call"]
+        )
+        self.any = failures.AddJSONFieldsResponse(1.0)
+        self.batches = failures.BatchNullResultResponse(1.0)
+        self.router = failures.FailureRouter(
+            [self.logs, self.calls, self.any, self.batches]
+        )
+
+    def test_lookup(self):
+        def route(request, peer=PEER):
+            return self.router._route(make_flow(request, peer))[0]
+
+        self.assertEqual(
+            route(call("eth_getLogs")), (self.logs, self.any, self.batches)
+        )
+        self.assertEqual(
+            route(call("eth_getLogs"), OTHER_PEER), (self.any, self.batches)
+        )
+        self.assertEqual(
+            route(call("eth_call"), OTHER_PEER),
+            (self.calls, self.any, self.batches),
+        )
+        self.assertEqual(
+            route([call("eth_call")]), (self.any, self.batches)
+        )
+        # Routes are resolved once per (method, peer)
+        self.assertIn(("eth_getLogs", PEER), self.router.routes)
+
+    def test_route(self):
+        flows = run_flows([self.router], [
+            call("eth_getLogs"), call("eth_call"), call("eth_chainId"),
+        ])
+        self.assertEqual(flows[0].response.status_code, 503)
+        self.assertEqual(body(flows[1]), {})
+        self.assertIn("new_field_0", body(flows[2])["result"])
+
+    def test_first_answer_wins(self):
+        node = FakeNode()
+        flow, = run_flows([self.router], [call("eth_getLogs")], node)
+        # Neither upstream nor the response failures saw the flow
+        self.assertEqual(node.requests, [])
+        self.assertEqual(flow.response.content, b"HTTP Error 503")
+
+
+class BatchFailureTest(unittest.TestCase):
+    BATCH = [
+        call("eth_blockNumber", id=1),
+        call("eth_getLogs", id=2),
+        call("eth_chainId", id=3),
+        call("eth_getLogs", id=4),
+    ]
+
+    def test_error_keeps_the_rest(self):
+        node = FakeNode()
+        failure = failures.BatchErrorResponse(
+            0.0, method_ratios={"eth_getLogs": 1.0}, error_codes=[-32005]
+        )
+        flow, = run_flows([failure], [self.BATCH], node)
+
+        # Only the other elements went upstream
+        self.assertEqual([c["id"] for c in node.requests[0]], [1, 3])
+        answer = body(flow)
+        self.assertEqual([e["id"] for e in answer], [1, 2, 3, 4])
+        for element in answer:
+            if element["id"] in [2, 4]:
+                self.assertEqual(element["error"]["code"], -32005)
+                self.assertNotIn("result", element)
+            else:
+                self.assertIn("result", element)
+
+    def test_error_whole_batch(self):
+        node = FakeNode()
+        failure = failures.BatchErrorResponse(1.0)
+        flow, = run_flows([failure], [self.BATCH], node)
+        self.assertEqual(node.requests, [])
+        self.assertEqual(
+            [e["id"] for e in body(flow) if "error" in e], [1, 2, 3, 4]
+        )
+
+    def test_missing_and_null(self):
+        missing = failures.BatchMissingElementResponse(
+            0.0, method_ratios={"eth_getLogs": 1.0}
+        )
+        flow, = run_flows([missing], [self.BATCH])
+        self.assertEqual([e["id"] for e in body(flow)], [1, 3])
+
+        null = failures.BatchNullResultResponse(
+            0.0, method_ratios={"eth_chainId": 1.0}
+        )
+        flow, = run_flows([null], [self.BATCH])
+        self.assertEqual(
+            [e["result"] is None for e in body(flow)],
+            [False, False, True, False],
+        )
+
+    def test_single_calls_untouched(self):
+        failure = failures.BatchErrorResponse(1.0)
+        flow, = run_flows([failure], [call("eth_getLogs")])
+        self.assertEqual(body(flow)["result"], {"method": "eth_getLogs"})
+
+
+class DeterminismTest(unittest.TestCase):
+    REQUESTS = [
+        call("eth_getBlockByNumber", [hex(n), False], id=n) for n in range(40)
+    ]
+
+    def results(self, failure):
+        flows = run_flows([failure, failures.JSONBodyFlush()], self.REQUESTS)
+        return [body(flow)["result"] for flow in flows]
+
+    def test_seeded(self):
+        first = self.results(failures.AddJSONFieldsResponse(0.5, seed=7))
+        self.assertEqual(
+            self.results(failures.AddJSONFieldsResponse(0.5, seed=7)), first
+        )
+        self.assertNotEqual(
+            self.results(failures.AddJSONFieldsResponse(0.5, seed=8)), first
+        )
+        injected = [len(result) > 2 for result in first]
+        self.assertTrue(any(injected) and not all(injected))
+
+    def test_record_replay(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "schedule.jsonl")
+            schedule = failures.FaultSchedule(path)
+            recorded = self.results(
+                failures.AddJSONFieldsResponse(0.5, seed=1, schedule=schedule)
+            )
+            schedule.file.close()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(
+                len(lines), sum(len(result) > 2 for result in recorded)
+            )
+
+            # The replay doesn't depend on its own seed nor ratio
+            replay = failures.FaultSchedule(path, replay=True)
+            replayed = self.results(
+                failures.AddJSONFieldsResponse(0.1, seed=2, schedule=replay)
+            )
+        self.assertEqual(replayed, recorded)
+
+
+class LaggedChainViewTest(unittest.TestCase):
+    def test_lagged_head(self):
+        node = FakeNode(head=100)
+        view = failures.LaggedChainView(
+            1.0, [PEER], lag_blocks=10, finality_lag_blocks=20
+        )
+
+        async def run():
+            with taddons.context() as tctx:
+                tctx.master.addons.add(view)
+
+                async def result(request, peer=PEER):
+                    flow = await run_flow(
+                        tctx, make_flow(request, peer), node
+                    )
+                    return body(flow)
+
+                # The head is learned from any peer
+                self.assertEqual(
+                    await result(call("eth_blockNumber"), OTHER_PEER),
+                    {"jsonrpc": "2.0", "id": 1, "result": hex(100)},
+                )
+                self.assertEqual(
+                    (await result(call("eth_blockNumber")))["result"],
+                    hex(90),
+                )
+
+                # The block is fetched along with the real head, which
+                # keeps being tracked
+                node.head = 105
+                block = await result(
+                    call("eth_getBlockByNumber", ["latest", False], id=7)
+                )
+                self.assertEqual(block["id"], 7)
+                self.assertEqual(block["result"]["number"], hex(90))
+                self.assertEqual(
+                    node.requests[-1][0]["params"], ["latest", False]
+                )
+                self.assertEqual(view.heads["latest"], 105)
+                self.assertEqual(
+                    (await result(call("eth_blockNumber")))["result"],
+                    hex(95),
+                )
+
+                # Finalized is learned first, then lagged, never ahead of
+                # the lagged latest block
+                await result(call("eth_getBlockByNumber", ["finalized"]))
+                finalized = await result(
+                    call("eth_getBlockByNumber", ["finalized", False])
+                )
+                self.assertEqual(finalized["result"]["number"], hex(85))
+
+        asyncio.run(run())
+        self.assertEqual(view.heads, {"latest": 105, "finalized": 105})
+
+
+class RateLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(
+            failures.time, "monotonic", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket(self):
+        bucket = failures._TokenBucket(rate=2, burst=2)
+        self.assertEqual([bucket.take(), bucket.take()], [0, 0])
+        self.assertEqual(bucket.take(), 0.5)
+        self.now += 0.25
+        self.assertEqual(bucket.take(), 0.25)
+        self.now += 0.25
+        self.assertEqual(bucket.take(), 0)
+        # Refills are capped by the burst
+        self.now += 60
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0.5])
+
+    def test_retry_after(self):
+        failure = failures.RateLimitResponse(
+            1.0, requests_per_second=0.25, burst=2
+        )
+
+        async def run():
+            node = FakeNode()
+            with taddons.context() as tctx:
+                tctx.master.addons.add(failure)
+
+                async def status(peer=PEER, id=1):
+                    flow = await run_flow(
+                        tctx, make_flow(call("eth_call", id=id), peer), node
+                    )
+                    return flow
+
+                self.assertEqual(
+                    [(await status()).response.status_code
+                     for _ in range(2)],
+                    [200, 200],
+                )
+                limited = await status(id=9)
+                self.assertEqual(limited.response.status_code, 429)
+                self.assertEqual(limited.response.headers["Retry-After"], "4")
+                self.assertEqual(body(limited)["id"], 9)
+                self.assertEqual(
+                    body(limited)["error"]["code"],
+                    failures.RateLimitResponse.ERROR_CODE,
+                )
+                # Each peer has its own budget
+                self.assertEqual(
+                    (await status(OTHER_PEER)).response.status_code, 200
+                )
+
+                # Rejected requests don't consume the budget
+                self.now += 3
+                self.assertEqual(
+                    (await status()).response.headers["Retry-After"], "1"
+                )
+                self.now += 1
+                self.assertEqual((await status()).response.status_code, 200)
+
+        asyncio.run(run())
+
+
+class FaultCampaignTest(unittest.TestCase):
+    def setUp(self):
+        d = tempfile.TemporaryDirectory()
+        self.addCleanup(d.cleanup)
+        self.path = os.path.join(d.name, "campaign.json")
+        self.campaign = failures.FaultCampaign(self.path)
+
+    def write(self, entries):
+        with open(self.path, "w") as f:
+            json.dump({"failures": entries}, f)
+        # Reloads are detected from the mtime and size
+        os.utime(self.path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        self.campaign._refresh()
+
+    def test_reload_and_drain(self):
+        self.write([{"class": "AddJSONFieldsResponse", "ratio": 1.0}])
+        first = self.campaign.generation
+        self.assertEqual(len(first.campaign), 1)
+        node = FakeNode()
+
+        async def run():
+            with taddons.context() as tctx:
+                tctx.master.addons.add(self.campaign)
+                in_flight = make_flow(call("eth_chainId"))
+                for hook in [
+                    layers.HttpRequestHeadersHook, layers.HttpRequestHook
+                ]:
+                    await tctx.master.addons.handle_lifecycle(hook(in_flight))
+                self.assertEqual(first.flows, 1)
+
+                self.write([{
+                    "class": "HttpErrorResponse", "ratio": 1.0,
+                    "methods": ["eth_call"], "args": {"error_codes": [502]},
+                }])
+                self.assertIsNot(self.campaign.generation, first)
+                self.assertTrue(first.retired)
+                self.assertFalse(first.stopped)
+
+                # The flow in flight finishes with the failures it started
+                # with, then the retired generation is stopped
+                node.respond(in_flight)
+                await tctx.master.addons.handle_lifecycle(
+                    layers.HttpResponseHook(in_flight)
+                )
+                self.assertIn("new_field_0", body(in_flight)["result"])
+                self.assertEqual(first.flows, 0)
+                self.assertTrue(first.stopped)
+
+                flow = await run_flow(
+                    tctx, make_flow(call("eth_chainId")), node
+                )
+                self.assertEqual(
+                    body(flow)["result"], {"method": "eth_chainId"}
+                )
+                flow = await run_flow(tctx, make_flow(call("eth_call")), node)
+                self.assertEqual(flow.response.status_code, 502)
+                self.assertEqual(self.campaign.generation.flows, 0)
+
+        asyncio.run(run())
+
+    def test_invalid_file_keeps_campaign(self):
+        self.write([{"class": "NullResponse", "ratio": 1.0}])
+        generation = self.campaign.generation
+        with self.assertLogs(level="ERROR"):
+            self.write([{"class": "NoSuchFailure"}])
+        self.assertIs(self.campaign.generation, generation)
+
+    def test_windows(self):
+        self.write([
+            {"class": "NullResponse", "ratio": 1.0, "windows": [[0, 60]]},
+            {"class": "EmptyJSONResponse", "ratio": 1.0},
+        ])
+        generation = self.campaign.generation
+        active = generation.router_at(generation.loaded_at + 30).failures
+        self.assertEqual(
+            [type(f).__name__ for f in active],
+            ["NullResponse", "EmptyJSONResponse"],
+        )
+        active = generation.router_at(generation.loaded_at + 60).failures
+        self.assertEqual(
+            [type(f).__name__ for f in active], ["EmptyJSONResponse"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
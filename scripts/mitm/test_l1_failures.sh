@@ -42,14 +42,19 @@ kurtosis enclave rm "$ENCLAVE_NAME" > /dev/null 2>&1
 kurtosis enclave add --name $ENCLAVE_NAME
 
 # Launch mitm docker in the background
+# Failures are driven by a hot reloaded campaign file, so switching between
+# them doesn't restart the addons nor drop the L1 connections.
 MITM_IP=$(docker network inspect kt-${ENCLAVE_NAME} | jq -r .[0].IPAM.Config[0].Subnet | cut -f1-3 -d.).199
-echo > remove_me_later.py
+CAMPAIGN_DIR=$(mktemp -d)
+echo '{"failures": []}' > "$CAMPAIGN_DIR"/campaign.yml
 (sleep 10 && docker run --detach --rm --name $L1_PROXY_NAME --network kt-${ENCLAVE_NAME} --ip "$MITM_IP" \
-    -v "$(pwd)"/scripts/mitm/failures.py:/failures.py:ro \
-    -v "$(pwd)"/remove_me_later.py:/mitm.py:ro \
+    -v "$(pwd)"/scripts/mitm/failures.py:/scripts/failures.py:ro \
+    -v "$(pwd)"/scripts/mitm/campaign.py:/scripts/campaign.py:ro \
+    -v "$CAMPAIGN_DIR":/campaign:ro \
+    -e MITM_CAMPAIGN=/campaign/campaign.yml \
     -p 127.0.0.1:8545:$L1_PROXY_PORT \
     mitmproxy/mitmproxy \
-    mitmdump --mode reverse:$REAL_RPC_URL -p 8234 -s /mitm.py) &
+    mitmdump --mode reverse:$REAL_RPC_URL -p 8234 -s /scripts/campaign.py) &
 
 # Deploy Kurtosis stack.
 kurtosis run --enclave "$ENCLAVE_NAME" . "$KURTOSIS_ARGS"
@@ -104,29 +109,32 @@ wait_for_verification() {
 if [ -n "$TEST_COMPONENT" ]; then
     DOCKER_ID="$(docker ps | grep "$(kurtosis service inspect "$ENCLAVE_NAME" "$TEST_COMPONENT" | grep UUID | awk '{print $2}')" | awk '{print $1}')"
     COMPONENT_IP=$(docker inspect "$DOCKER_ID" | jq -r '.[0].NetworkSettings.Networks."kt-'$ENCLAVE_NAME'".IPAddress')
-    SELECTED_PEERS="'$COMPONENT_IP'"
+    SELECTED_PEERS="\"$COMPONENT_IP\""
     echo "Selected peers: $SELECTED_PEERS"
 fi
 
 
 # Set CLASSES if empty
+# Skipped: MultiUpstreamRedirect needs its upstreams, and the Batch* classes
+# do nothing to the non batched L1 requests made here.
 if [ -z "$CLASSES" ]; then
-    CLASSES=$(sed -n 's/^class \([A-Za-z0-9]\+\).*/\1/p'  scripts/mitm/failures.py  | grep -v Generic)
+    CLASSES=$(sed -n 's/^class \([A-Za-z0-9]\+\)(Generic.*/\1/p'  scripts/mitm/failures.py  | grep -v Generic | grep -v -e '^MultiUpstreamRedirect$' -e '^Batch')
 fi
 # Test failures, 2 minutes each
 for class in $CLASSES; do
-    echo "import failures" > remove_me_later.py
     if [ "$class" == "RedirectRequest" ]; then
-        redirect_url="http://cdk-erigon-rpc-001:8123"
-        echo "addons = [failures.${class}(${TEST_PERCENTAGE}, [$SELECTED_PEERS], '${redirect_url}')]" >> remove_me_later.py
+        args='{"redirect_url": "http://cdk-erigon-rpc-001:8123"}'
     else
-        echo "addons = [failures.${class}(${TEST_PERCENTAGE}, [$SELECTED_PEERS])]" >> remove_me_later.py
+        args='{}'
     fi
-    echo >> remove_me_later.py
+    # Write then rename, so the campaign is never read half written
+    echo '{"failures": [{"class": "'"$class"'", "ratio": '"$TEST_PERCENTAGE"', "peers": ['"$SELECTED_PEERS"'], "args": '"$args"'}]}' > "$CAMPAIGN_DIR"/campaign.yml.tmp
+    mv "$CAMPAIGN_DIR"/campaign.yml.tmp "$CAMPAIGN_DIR"/campaign.yml
     echo "Testing failure class $class for a $TEST_DURATION seconds"
     sleep $TEST_DURATION
     echo "Resuming normal operation"
-    echo > remove_me_later.py
+    echo '{"failures": []}' > "$CAMPAIGN_DIR"/campaign.yml.tmp
+    mv "$CAMPAIGN_DIR"/campaign.yml.tmp "$CAMPAIGN_DIR"/campaign.yml
     if [ "$CHECK_SC_VERIFICATION" -eq 1 ]; then
         if wait_for_verification "$TIMEOUT"; then
             echo "Verification successful!"
@@ -153,4 +161,4 @@ echo "Cleaning up..."
 kurtosis enclave stop "$ENCLAVE_NAME"
 kurtosis enclave rm "$ENCLAVE_NAME"
 docker stop "$L1_PROXY_NAME"
-rm remove_me_later.py
+rm -r "$CAMPAIGN_DIR"
@@ -13,10 +13,18 @@ It generates an updated version matrix with status indicators.
 import os
 import re
 import json
+import hashlib
+import time
+import random
+import argparse
+import threading
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, total_ordering
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict, replace
 from datetime import datetime
 
@@ -33,6 +41,130 @@ class ComponentVersion:
     pin_reason: Optional[str] = None
 
 
+@total_ordering
+@dataclass(frozen=True, eq=False)
+class Version:
+    """A parsed version, ordered by SemVer precedence.
+
+    Parsing is lenient, as image tags are: a leading `v` is dropped, missing
+    minor and patch numbers are 0, and numbers past the patch (`1.2.3.4`) are
+    kept as a revision of the release. Prerelease identifiers are compared
+    case-insensitively and split between letters and digits, so `RC2` is
+    `rc.2`. Tags that are not versions at all (`latest`, branch names,
+    commit shas) don't parse.
+    """
+    major: int
+    minor: int
+    patch: int
+    revision: Tuple[int, ...] = ()
+    prerelease: Tuple[str, ...] = ()
+    build: Tuple[str, ...] = ()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def parse(text: str) -> Optional['Version']:
+        text, _, build = text.partition('+')
+        match = re.fullmatch(r'v?(\d+(?:\.\d+)*)(?:-(.+))?', text)
+        if not match:
+            return None
+        numbers, prerelease = match.groups()
+        major, minor, patch, *revision = [int(n) for n in numbers.split('.')] + [0] * 2
+        # 1.2.3 and 1.2.3.0 are the same release
+        while revision and revision[-1] == 0:
+            revision.pop()
+        return Version(
+            major, minor, patch, tuple(revision),
+            tuple(re.findall(r'\d+|[^\d.\-]+', prerelease.lower())) if prerelease else (),
+            tuple(build.split('.')) if build else (),
+        )
+
+    @property
+    def release(self) -> 'Version':
+        """The release this version is a prerelease of."""
+        return Version(self.major, self.minor, self.patch, self.revision)
+
+    def _key(self) -> tuple:
+        # Prereleases sort before their release. Numeric identifiers compare
+        # numerically and before alphanumeric ones, and a shorter set of
+        # identifiers comes first when all the others are equal.
+        if not self.prerelease:
+            prerelease = (1,)
+        else:
+            prerelease = (0, tuple(
+                (0, int(identifier), '') if identifier.isdigit() else (1, 0, identifier)
+                for identifier in self.prerelease
+            ))
+        # Build metadata doesn't take part in precedence
+        return (self.major, self.minor, self.patch, self.revision, prerelease)
+
+    def __eq__(self, other):
+        return isinstance(other, Version) and self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+@dataclass(frozen=True)
+class SuffixRule:
+    """How a component's tags with a given prerelease suffix are judged.
+
+    - "release": a downstream fix on top of the release, so it counts as
+      the release itself.
+    - "experimental": always newer than stable.
+    """
+    suffix: str
+    meaning: str
+
+    def matches(self, version: Version) -> bool:
+        return '.'.join(version.prerelease).endswith(self.suffix)
+
+
+def _apply_suffix_rules(version: Version, component: Optional[str]) -> Version:
+    for rule in SUFFIX_RULES.get(component, []):
+        if rule.matches(version):
+            return version.release if rule.meaning == "release" else version
+    return version
+
+
+# Suffix rules, keyed by component. Versions without a matching rule follow
+# plain SemVer precedence.
+SUFFIX_RULES = {
+    # We use the latest op-deployer with a small fix on top, suffixed `-cdk`
+    "op-deployer": [SuffixRule("cdk", "release")],
+    # Same for op-succinct-proposer, suffixed `-agglayer`
+    "op-succinct-proposer": [SuffixRule("agglayer", "release")],
+    "agglayer-contracts": [SuffixRule("aggchain.multisig", "experimental")],
+}
+
+
+@lru_cache(maxsize=None)
+def version_status(version: str, latest_version: str, component: Optional[str] = None) -> str:
+    """Status of version against the latest stable one, for component."""
+    if version == latest_version:
+        return "matches stable"
+    current = Version.parse(version)
+    latest = Version.parse(latest_version)
+    # A tag that isn't a version can't be ordered against a release
+    if current is None:
+        return "behind stable"
+    if latest is None:
+        return "newer than stable"
+
+    if any(rule.meaning == "experimental" and rule.matches(current)
+           for rule in SUFFIX_RULES.get(component, [])):
+        return "newer than stable"
+    current = _apply_suffix_rules(current, component)
+    latest = _apply_suffix_rules(latest, component)
+    if current > latest:
+        return "newer than stable"
+    if current < latest:
+        return "behind stable"
+    return "matches stable"
+
+
 # Components deliberately held back from the latest stable release, keyed by
 # (environment, component). These render as "pinned" instead of "behind stable"
 # so that genuine regressions stay visible in the matrix.
@@ -97,12 +229,203 @@ PACKAGE_TRACKING_MODE = {
 # meaningful gap.
 HEAD_TRACKING_STALE_AFTER_DAYS = 14
 
+# Concurrent GitHub API requests when resolving latest versions up front.
+GITHUB_MAX_WORKERS = 8
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Optimism components share the monorepo, their releases are told apart by
+# their `<component>/v<version>` tag prefix.
+OP_STACK_COMPONENTS = ['op-batcher', 'op-deployer', 'op-node', 'op-proposer', 'op-reth']
+
+# Components without any release, whose latest version is their latest tag.
+TAG_ONLY_COMPONENTS = [
+    'zkevm-prover', 'zkevm-bridge-service', 'op-succinct-proposer',
+    'zkevm-pool-manager', 'cdk-data-availability'
+]
+
+# Retries of transient GitHub API failures: 5xx, 429, and 403 secondary
+# rate limits. Backoff doubles on each attempt unless GitHub says how long to
+# wait, and waits longer than GITHUB_MAX_WAIT_SECONDS are not worth it.
+GITHUB_MAX_RETRIES = 5
+GITHUB_BACKOFF_SECONDS = 1
+GITHUB_MAX_WAIT_SECONDS = 300
+# GitHub asks to wait at least a minute after hitting a secondary rate limit
+GITHUB_SECONDARY_RATE_LIMIT_SECONDS = 60
+
+
+class GitHubSession:
+    """Pooled GitHub API session with retries and rate limit awareness.
+
+    Once X-RateLimit-Remaining drops to 0, every request waits for
+    X-RateLimit-Reset instead of failing. A secondary rate limit without
+    Retry-After blocks every request for at least a minute, doubling on each
+    retry. Request times are recorded per endpoint (releases, tags, commits,
+    compare...) for the run summary.
+    """
+
+    RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'token {os.getenv("GITHUB_TOKEN")}'
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=GITHUB_MAX_WORKERS))
+        self.lock = threading.Lock()
+        self.blocked_until = 0.0
+        # endpoint -> [requests, retries, total seconds, max seconds]
+        self.timings: Dict[str, List] = {}
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        """'https://api.github.com/repos/o/r/commits/abc' -> 'commits'"""
+        if url == GITHUB_GRAPHQL_URL:
+            return 'graphql'
+        parts = url.split('?')[0].split('/')[6:]
+        if parts[:2] == ['releases', 'latest']:
+            return 'releases/latest'
+        return parts[0] if parts else 'repos'
+
+    def _record(self, url: str, seconds: float, retry: bool):
+        with self.lock:
+            timing = self.timings.setdefault(self._endpoint(url), [0, 0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += int(retry)
+            timing[2] += seconds
+            timing[3] = max(timing[3], seconds)
+
+    def _rate_limited(self, response: requests.Response) -> bool:
+        if response.headers.get('X-RateLimit-Remaining') != '0':
+            return False
+        with self.lock:
+            self.blocked_until = max(
+                self.blocked_until,
+                float(response.headers.get('X-RateLimit-Reset', 0)))
+        return True
+
+    @staticmethod
+    def _secondary_rate_limited(response: requests.Response) -> bool:
+        # A plain 403 (e.g. a private repo) is not worth retrying
+        return response.status_code == 429 or (
+            response.status_code == 403 and 'rate limit' in response.text.lower())
+
+    def _retry_wait(self, response: Optional[requests.Response], attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if it is not worth it."""
+        if response is not None:
+            rate_limited = self._rate_limited(response)
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+            if rate_limited and response.status_code in [403, 429]:
+                return max(0.0, self.blocked_until - time.time())
+            if self._secondary_rate_limited(response):
+                wait = GITHUB_SECONDARY_RATE_LIMIT_SECONDS * 2 ** attempt
+                with self.lock:
+                    self.blocked_until = max(self.blocked_until, time.time() + wait)
+                return wait
+            if response.status_code not in self.RETRY_STATUS_CODES:
+                return None
+        return GITHUB_BACKOFF_SECONDS * 2 ** attempt * random.uniform(1, 1.5)
+
+    def get(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        return self.request('GET', url, headers=headers)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        for attempt in range(GITHUB_MAX_RETRIES + 1):
+            wait = self.blocked_until - time.time()
+            if 0 < wait <= GITHUB_MAX_WAIT_SECONDS:
+                time.sleep(wait)
+
+            start = time.monotonic()
+            response, error = None, None
+            try:
+                response = self.session.request(method, url, timeout=10, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            self._record(url, time.monotonic() - start, attempt > 0)
+
+            wait = self._retry_wait(response, attempt)
+            if wait is None:
+                return response
+            if attempt == GITHUB_MAX_RETRIES or wait > GITHUB_MAX_WAIT_SECONDS:
+                break
+            reason = response.status_code if response is not None else error
+            print(f"Retrying {url} in {wait:.1f}s ({reason})")
+            time.sleep(wait)
+
+        if response is None:
+            raise error
+        return response
+
+    def print_timings(self):
+        if not self.timings:
+            return
+        print("\n=== GitHub API Requests ===")
+        for endpoint, (count, retries, total, slowest) in sorted(self.timings.items()):
+            print(f"{endpoint}: {count} requests ({retries} retries), "
+                  f"avg {total / count * 1000:.0f}ms, max {slowest * 1000:.0f}ms")
+
+
+# matrix.json records the hashes of the files it was built from, so that the
+# next run only rebuilds what depends on changed files. Upstream (GitHub) data
+# older than this is refreshed by a full rebuild, so nightly runs always are.
+UPSTREAM_MAX_AGE_HOURS = 12
+
+# Where GitHub API responses are kept between runs (gitignored).
+DEFAULT_HTTP_CACHE_DIR = Path(__file__).parent / ".cache"
+
+
+class HTTPCache:
+    """Persistent cache of GitHub API responses, one JSON file per URL.
+
+    Entries keep the ETag and Last-Modified validators of the response, so
+    the next run can revalidate them with a conditional request: GitHub
+    answers 304 when nothing changed, and 304s don't count against the rate
+    limit.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+
+    def _path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def load(self, url: str) -> Optional[Dict]:
+        try:
+            with open(self._path(url), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, url: str, status_code: int, data, headers):
+        entry = {
+            'url': url,
+            'status_code': status_code,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': datetime.now().isoformat(),
+            'data': data,
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(url)
+        # Write then rename, so concurrent runs never read half an entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
 
 class VersionMatrixExtractor:
     """Extracts and manages version matrix information."""
 
-    def __init__(self, repo_root: Path):
+    def __init__(self, repo_root: Path, http_cache: Optional[HTTPCache] = None,
+                 offline: bool = False, graphql: bool = False):
         self.repo_root = repo_root
+        self.http_cache = http_cache
+        self.github = GitHubSession()
+        # Build the matrix from http_cache only, without any request
+        self.offline = offline
+        # Resolve most lookups with batched GraphQL queries, see prefetch_graphql
+        self.graphql = graphql
         self.constants_path = repo_root / "src" / "package_io" / "constants.star"
         self.kurtosis_yaml_path = repo_root / "kurtosis.yml"
 
@@ -194,6 +517,12 @@ class VersionMatrixExtractor:
             "lighthouse": "sigp/lighthouse",
         }
 
+        # GitHub API responses and latest versions, fetched once per run.
+        # Components sharing a repo (the op-* ones) share its responses.
+        self._responses: Dict[str, Future] = {}
+        self._latest_versions: Dict[str, Future] = {}
+        self._cache_lock = threading.Lock()
+
     def extract_default_images(self) -> Dict[str, ComponentVersion]:
         """Extract default image versions from constants.star."""
         components = {}
@@ -233,7 +562,7 @@ class VersionMatrixExtractor:
                         latest_version_source_url = self._get_source_url(
                             name, latest_version)
                         status = self._determine_status(
-                            version, latest_version)
+                            version, latest_version, name)
 
                         components[name] = ComponentVersion(
                             version=version,
@@ -292,7 +621,7 @@ class VersionMatrixExtractor:
                 if comp_name == 'agglayer' and version == '0.4.4-remove-agglayer-prover':
                     return f"https://github.com/{repo}/tree/38ffe04e71bb6b0eb22a244dbd40d189e1b0d78f"
 
-                if comp_name in ['op-batcher', 'op-deployer', 'op-node', 'op-proposer', 'op-reth']:
+                if comp_name in OP_STACK_COMPONENTS:
                     return f"https://github.com/{repo}/releases/tag/{comp_name}/v{version.lstrip('v')}"
 
                 if version not in ['latest', 'main', 'master']:
@@ -310,20 +639,185 @@ class VersionMatrixExtractor:
         """
         return re.search(r'-(alpha|beta|rc|test)', tag_name, re.IGNORECASE) is not None
 
+    def _memoized(self, cache: Dict[str, Future], key: str, fetch):
+        """Return fetch() for key, computed once per run.
+
+        Concurrent callers asking for the same key wait for the first one
+        instead of fetching it again.
+        """
+        with self._cache_lock:
+            future = cache.get(key)
+            owner = future is None
+            if owner:
+                future = cache[key] = Future()
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def _fetch_json(self, url: str) -> tuple:
+        """GET a GitHub API URL once per run, returning (status_code, json).
+
+        Responses in http_cache are revalidated rather than downloaded again,
+        and in offline mode they are used as they are.
+        """
+        def fetch():
+            cached = self.http_cache.load(url) if self.http_cache else None
+            if self.offline:
+                if cached is None:
+                    print(f"Not cached, skipping in offline mode: {url}")
+                    return None, None
+                return cached['status_code'], cached['data']
+
+            headers = {}
+            if cached and cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached and cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+            response = self.github.get(url, headers)
+            if response.status_code == 304 and cached:
+                return cached['status_code'], cached['data']
+
+            data = response.json() if response.status_code == 200 else None
+            # 404s are legitimate answers for some endpoints, keep them too
+            # so that offline runs see the same thing
+            if self.http_cache and response.status_code in [200, 404]:
+                self.http_cache.store(url, response.status_code, data, response.headers)
+            return response.status_code, data
+        return self._memoized(self._responses, url, fetch)
+
+    def prefetch_latest_versions(self):
+        """Resolve the latest version of every component concurrently.
+
+        Later lookups, repeated for each environment, are then served from
+        memory, so a run costs one request per repo endpoint.
+        """
+        with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as executor:
+            list(executor.map(self._get_latest_version, self.repos))
+
+    def _seed_response(self, url: str, status_code: int, data):
+        """Answer a later _fetch_json(url) with (status_code, data)."""
+        with self._cache_lock:
+            if url not in self._responses:
+                future = self._responses[url] = Future()
+                future.set_result((status_code, data))
+
+    def _graphql_repo_query(self, alias: str, repo: str, releases: bool,
+                            tags: bool, head: bool, refs: List[str]) -> str:
+        """GraphQL selection of what the REST lookups need from one repo."""
+        commit = (
+            "... on Commit { oid committedDate } "
+            "... on Tag { target { ... on Commit { oid committedDate } } }"
+        )
+        owner, name = repo.split('/')
+        fields = ["latestRelease { tagName publishedAt }"]
+        if releases:
+            fields.append(
+                "releases(first: 100, orderBy: {field: CREATED_AT, direction: DESC})"
+                " { nodes { tagName } }")
+        if tags:
+            fields.append(
+                'tags: refs(refPrefix: "refs/tags/", first: 30,'
+                " orderBy: {field: TAG_COMMIT_DATE, direction: DESC})"
+                f" {{ nodes {{ name target {{ {commit} }} }} }}")
+        if head:
+            fields.append(
+                "defaultBranchRef { target { ... on Commit { oid committedDate } } }")
+        for i, ref in enumerate(refs):
+            fields.append(f"ref{i}: object(expression: {json.dumps(ref)}) {{ {commit} }}")
+        return (f"{alias}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)})"
+                f" {{ {' '.join(fields)} }}")
+
+    def prefetch_graphql(self):
+        """Resolve the releases, tags and commits of every repo in one query.
+
+        The answers are turned into the REST responses the lookups expect and
+        served by _fetch_json, so the rest of the extraction is unchanged.
+        Compare (ahead/behind) has no GraphQL equivalent and stays on REST, as
+        do tag listings, whose order GraphQL can't reproduce, and anything the
+        query could not resolve.
+        """
+        # repo -> (releases, tags, head, refs)
+        wanted: Dict[str, tuple] = {}
+        for component, repo in self.repos.items():
+            releases, tags, head, refs = wanted.get(repo, (False, False, False, []))
+            wanted[repo] = (releases or component in OP_STACK_COMPONENTS,
+                            tags or component in TAG_ONLY_COMPONENTS, head, refs)
+        for replacement in self._load_replace_options().values():
+            _, repo, pin = self._parse_replacement(replacement)
+            if repo:
+                releases, _, _, refs = wanted.get(repo, (False, False, False, []))
+                wanted[repo] = (releases, True, True, refs + self._ref_candidates(pin))
+
+        aliases = {f"repo{i}": repo for i, repo in enumerate(wanted)}
+        query = "query { %s }" % " ".join(
+            self._graphql_repo_query(alias, repo, *wanted[repo])
+            for alias, repo in aliases.items())
+        try:
+            response = self.github.request('POST', GITHUB_GRAPHQL_URL, json={'query': query})
+            body = response.json() if response.status_code == 200 else {}
+        except Exception as e:
+            print(f"Error fetching GraphQL data, falling back to REST: {e}")
+            return
+        for error in body.get('errors') or []:
+            print(f"GraphQL: {error.get('message')}")
+        results = body.get('data') or {}
+
+        def commit_of(target):
+            target = (target or {}).get('target', target) or {}
+            if not target.get('committedDate'):
+                return None
+            return {'sha': target['oid'], 'commit': {'committer': {'date': target['committedDate']}}}
+
+        for alias, repo in aliases.items():
+            node = results.get(alias)
+            if not node:
+                continue
+            base = f"https://api.github.com/repos/{repo}"
+            release = node.get('latestRelease')
+            if release:
+                self._seed_response(f"{base}/releases/latest", 200, {
+                    'tag_name': release['tagName'], 'published_at': release['publishedAt']})
+            else:
+                self._seed_response(f"{base}/releases/latest", 404, None)
+            if 'releases' in node:
+                self._seed_response(f"{base}/releases?per_page=100", 200, [
+                    {'tag_name': n['tagName']} for n in node['releases']['nodes']])
+            # The tag listings stay on REST, which orders them by name rather
+            # than by commit date, and the first match is taken as the latest
+            for tag in (node.get('tags') or {}).get('nodes') or []:
+                commit = commit_of(tag['target'])
+                if commit:
+                    self._seed_response(f"{base}/commits/{tag['name']}", 200, commit)
+            head = commit_of((node.get('defaultBranchRef') or {}).get('target'))
+            if head:
+                self._seed_response(f"{base}/commits?per_page=1", 200, [head])
+            # A ref the query could not resolve, e.g. a short sha, is left to REST
+            for i, ref in enumerate(wanted[repo][3]):
+                commit = commit_of(node.get(f"ref{i}"))
+                if commit:
+                    self._seed_response(f"{base}/commits/{ref}", 200, commit)
+
     def _get_latest_version(self, component: str) -> Optional[str]:
+        """Latest version of a component, resolved once per run."""
+        return self._memoized(
+            self._latest_versions, component,
+            lambda: self._resolve_latest_version(component))
+
+    def _resolve_latest_version(self, component: str) -> Optional[str]:
         """Fetch the latest version from GitHub releases."""
         repo = self.repos.get(component)
         if not repo:
             return None
 
         try:
-            if component in ['op-batcher', 'op-deployer', 'op-node', 'op-proposer', 'op-reth']:
+            if component in OP_STACK_COMPONENTS:
                 url = f"https://api.github.com/repos/{repo}/releases?per_page=100"
-                response = requests.get(url, timeout=10, headers={
-                    'Authorization': f'token {os.getenv("GITHUB_TOKEN")}'})
+                status_code, releases = self._fetch_json(url)
 
-                if response.status_code == 200:
-                    releases = response.json()
+                if status_code == 200:
                     for release in releases:
                         if 'tag_name' in release:
                             tag_name = release['tag_name']
@@ -335,21 +829,14 @@ class VersionMatrixExtractor:
                                     r'^v?', '', tag_name.split("/")[-1])
                                 return version
                 else:
-                    print(f"Error fetching latest version for {component}: {response.status_code} from {url}")
+                    print(f"Error fetching latest version for {component}: {status_code} from {url}")
                     return None
 
             # These components don't have any release, thus we rely on tags
-            if component in [
-                'zkevm-prover', 'zkevm-bridge-service', 'op-succinct-proposer',
-                'zkevm-pool-manager', 'cdk-data-availability'
-            ]:
+            if component in TAG_ONLY_COMPONENTS:
                 url = f"https://api.github.com/repos/{repo}/tags"
-                response = requests.get(
-                    url, timeout=10,
-                    headers={'Authorization': f'token {os.getenv("GITHUB_TOKEN")}'}
-                )
-                if response.status_code == 200:
-                    tags = response.json()
+                status_code, tags = self._fetch_json(url)
+                if status_code == 200:
                     for tag in tags:
                         if 'name' in tag:
                             tag_name = tag['name']
@@ -365,94 +852,45 @@ class VersionMatrixExtractor:
                             latest_version = re.sub(r'^v?', '', tag_name)
                             return latest_version
                 else:
-                    print(f"Error fetching latest version for {component}: {response.status_code} from {url}")
+                    print(f"Error fetching latest version for {component}: {status_code} from {url}")
                     return None
 
             url = f"https://api.github.com/repos/{repo}/releases/latest"
-            response = requests.get(url, timeout=10, headers={
-                                    'Authorization': f'token {os.getenv("GITHUB_TOKEN")}'})
+            status_code, release_data = self._fetch_json(url)
 
-            if response.status_code == 200:
-                release_data = response.json()
+            if status_code == 200:
                 tag = release_data['tag_name']
                 version = re.sub(r'^v?', '', tag)
                 return version
             else:
-                print(f"Error fetching latest version for {component}: {response.status_code} from {url}")
+                print(f"Error fetching latest version for {component}: {status_code} from {url}")
                 return None
 
         except Exception as e:
             print(f"Error fetching latest version for {component}: {e}")
             return None
 
-    def _determine_status(self, version: str, latest_version: str) -> Optional[str]:
-        """Determine the status of a version based on various factors."""
+    def _determine_status(self, version: str, latest_version: str,
+                          component: Optional[str] = None) -> Optional[str]:
+        """Determine the status of a version against the latest stable one."""
         # Check if version is unknown
         if not latest_version:
             return None
+        return version_status(version, latest_version, component)
 
-        # Helper function to convert version string to comparable integer
-        def version_to_int(v):
-            # Remove any non-digit prefix and split by dots
-            clean_version = v.split('-')[0]  # Remove suffixes like "-beta1"
-            parts = clean_version.split('.')
-
-            # Pad with zeros if less parts available
-            while len(parts) < 3:
-                parts.append('0')
-
-            try:
-                # Convert to integer with larger multipliers to handle big numbers
-                # 1000000 for major, 1000 for minor, 1 for patch
-                major = int(parts[0]) if parts[0].isdigit() else 0
-                minor = int(parts[1]) if parts[1].isdigit() else 0
-                patch = int(parts[2]) if parts[2].isdigit() else 0
-                return major * 1000000 + minor * 1000 + patch
-            except (ValueError, IndexError):
-                return 0
-
-        # Check if version is greater than latest (e.g., pre-release)
-        try:
-            version_float = version_to_int(version)
-            version_suffix = version.split('-')[1] if '-' in version else ''
-            latest_float = version_to_int(latest_version)
-            latest_suffix = latest_version.split('-')[1] if '-' in latest_version else ''
-
-            # special case for agglayer-contracts
-            experimental_status = "newer than stable"
-            stable_status = "matches stable"
-            deprecated_status = "behind stable"
-            
-            if version_suffix.endswith("aggchain.multisig"):
-                return experimental_status
-
-            if version_float > latest_float:
-                return experimental_status
-            elif version_float < latest_float:
-                return deprecated_status
-            else:
-                if version_suffix == latest_suffix:
-                    return stable_status
-                # special case for op-deployer - we use the latest version with a small fix on top, suffixed with `-cdk`
-                if version_suffix == "cdk" and not latest_suffix:
-                    return stable_status
-                # special case for op-succinct-proposer - we use the latest version with a small fix on top, suffixed with `-agglayer`
-                if version_suffix == "agglayer" and not latest_suffix:
-                    return stable_status
-
-                return experimental_status
+    def extract_test_environments(self, default_images: Dict[str, str],
+                                  only: Optional[Set[str]] = None) -> Dict[str, TestEnvironment]:
+        """Extract test environments from .github/tests/ configurations.
 
-        except Exception as e:
-            print(f"Error determining status for version {version}: {e}")
-            return "unknown"
-
-    def extract_test_environments(self, default_images: Dict[str, str]) -> Dict[str, TestEnvironment]:
-        """Extract test environments from .github/tests/ configurations."""
+        With only, just those environment types are extracted.
+        """
         environments = {}
 
         try:
             # Walk through test configuration files
             for (environment_type, yaml_file) in self.test_files_paths:
+                if only is not None and environment_type not in only:
+                    continue
                 try:
                     with open(yaml_file, 'r') as f:
                         config = yaml.safe_load(f)
@@ -639,7 +1077,7 @@ class VersionMatrixExtractor:
                     version_source_url=version_source_url,
                     latest_version=latest_version,
                     latest_version_source_url=latest_version_source_url,
-                    status=self._determine_status(version, latest_version)
+                    status=self._determine_status(version, latest_version, name)
                 )
 
         return components
@@ -681,7 +1119,7 @@ class VersionMatrixExtractor:
                             version_source_url=version_source_url,
                             latest_version=latest_version,
                             latest_version_source_url=latest_version_source_url,
-                            status=self._determine_status(version, latest_version)
+                            status=self._determine_status(version, latest_version, name)
                         )
                 
                 # Extract op-node from cl (consensus layer)
@@ -701,7 +1139,7 @@ class VersionMatrixExtractor:
                             version_source_url=version_source_url,
                             latest_version=latest_version,
                             latest_version_source_url=latest_version_source_url,
-                            status=self._determine_status(version, latest_version)
+                            status=self._determine_status(version, latest_version, name)
                         )
             
             # Extract from batcher_params
@@ -721,7 +1159,7 @@ class VersionMatrixExtractor:
                         version_source_url=version_source_url,
                         latest_version=latest_version,
                         latest_version_source_url=latest_version_source_url,
-                        status=self._determine_status(version, latest_version)
+                        status=self._determine_status(version, latest_version, name)
                     )
             
             # Extract from proposer_params
@@ -741,7 +1179,7 @@ class VersionMatrixExtractor:
                         version_source_url=version_source_url,
                         latest_version=latest_version,
                         latest_version_source_url=latest_version_source_url,
-                        status=self._determine_status(version, latest_version)
+                        status=self._determine_status(version, latest_version, name)
                     )
         
         # Extract from top-level optimism_package configurations
@@ -760,32 +1198,117 @@ class VersionMatrixExtractor:
                     version_source_url=version_source_url,
                     latest_version=latest_version,
                     latest_version_source_url=latest_version_source_url,
-                    status=self._determine_status(version, latest_version)
+                    status=self._determine_status(version, latest_version, name)
                 )
         
         return components
 
-    def generate_version_matrix(self) -> Dict:
-        """Generate comprehensive version matrix."""
+    def _relative_path(self, path: Path) -> str:
+        return str(path.resolve().relative_to(self.repo_root.resolve()))
+
+    def _input_hashes(self) -> Dict[str, Optional[str]]:
+        """SHA-256 of every file the matrix is built from, this script included."""
+        paths = [Path(__file__), self.constants_path, self.kurtosis_yaml_path]
+        paths += [path for _, path in self.test_files_paths]
+        hashes = {}
+        for path in paths:
+            try:
+                hashes[self._relative_path(path)] = hashlib.sha256(path.read_bytes()).hexdigest()
+            except OSError:
+                hashes[self._relative_path(path)] = None
+        return hashes
+
+    def _upstream_expired(self, fetched_at: Optional[str]) -> bool:
+        try:
+            age = datetime.now() - datetime.fromisoformat(fetched_at)
+        except (TypeError, ValueError):
+            return True
+        return age.total_seconds() > UPSTREAM_MAX_AGE_HOURS * 3600
+
+    def _seed_latest_versions(self, previous: Dict):
+        """Reuse the latest versions resolved by the previous run."""
+        components = list(previous.get('default_images', {}).items())
+        for environment in previous.get('test_environments', {}).values():
+            components += environment.get('components', {}).items()
+        with self._cache_lock:
+            for name, component in components:
+                # Failed lookups are retried
+                if component.get('latest_version') and name not in self._latest_versions:
+                    future = self._latest_versions[name] = Future()
+                    future.set_result(component['latest_version'])
+
+    def generate_version_matrix(self, previous: Optional[Dict] = None) -> Dict:
+        """Generate comprehensive version matrix.
+
+        Given the previous matrix, only the environments and packages whose
+        input files changed are rebuilt, reusing its upstream data, unless
+        that data has expired or this script changed.
+        """
+        hashes = self._input_hashes()
+        inputs = (previous or {}).get('inputs') or {}
+        changed = {
+            path for path, digest in hashes.items()
+            if (inputs.get('hashes') or {}).get(path) != digest
+        }
+        incremental = (
+            previous is not None
+            and not self._upstream_expired(inputs.get('upstream_fetched_at'))
+            and self._relative_path(Path(__file__)) not in changed
+        )
+
+        if incremental and not changed:
+            print("Inputs unchanged and upstream data still fresh, nothing to rebuild.")
+            return {**previous, 'generated_at': datetime.now().isoformat()}
+
+        if incremental:
+            print(f"Rebuilding from changed inputs: {', '.join(sorted(changed))}")
+            self._seed_latest_versions(previous)
+            upstream_fetched_at = inputs['upstream_fetched_at']
+        else:
+            if self.graphql and not self.offline:
+                print("Fetching GitHub data with GraphQL...")
+                self.prefetch_graphql()
+
+            print("Fetching latest component versions...")
+            self.prefetch_latest_versions()
+            upstream_fetched_at = datetime.now().isoformat()
+
         print("Extracting default images...")
         default_images = self.extract_default_images()
         filtered_default_images = self.filter_default_images(default_images)
 
+        # Environments inherit the default images, so they all depend on
+        # constants.star on top of their own test file.
+        only = None
+        if incremental and self._relative_path(self.constants_path) not in changed:
+            only = {
+                environment_type for environment_type, path in self.test_files_paths
+                if self._relative_path(path) in changed
+            }
+
         print("Extracting test environments...")
-        test_environments = self.extract_test_environments(default_images)
+        test_environments = {
+            name: asdict(environment)
+            for name, environment in self.extract_test_environments(default_images, only).items()
+        }
+        if only is not None:
+            test_environments = {**previous['test_environments'], **test_environments}
 
-        print("Extracting external Kurtosis packages...")
-        packages = self.extract_packages()
+        if incremental and self._relative_path(self.kurtosis_yaml_path) not in changed:
+            packages = previous.get('packages', {})
+        else:
+            print("Extracting external Kurtosis packages...")
+            packages = {name: asdict(package) for name, package in self.extract_packages().items()}
 
         # Count environments by type
         environment_counts = {
             'total': len(test_environments)
         }
-        for environment in test_environments.values():
+        for environment_type in test_environments:
             architecture = 'unknown'
-            if environment.type.startswith('cdk-opreth'):
+            if environment_type.startswith('cdk-opreth'):
                 architecture = 'cdk-opreth'
-            elif environment.type.startswith('cdk-erigon'):
+            elif environment_type.startswith('cdk-erigon'):
                 architecture = 'cdk-erigon'
 
             environment_counts[architecture] = environment_counts.get(
@@ -795,13 +1318,17 @@ class VersionMatrixExtractor:
         matrix = {
             'generated_at': datetime.now().isoformat(),
             'default_images': {name: asdict(comp) for name, comp in filtered_default_images.items()},
-            'test_environments': {name: asdict(environment) for name, environment in test_environments.items()},
-            'packages': {name: asdict(package) for name, package in packages.items()},
+            'test_environments': test_environments,
+            'packages': packages,
             'summary': {
                 'total_components': len(default_images),
                 'total_packages': len(packages),
                 'environments': environment_counts,
-            }
+            },
+            'inputs': {
+                'hashes': hashes,
+                'upstream_fetched_at': upstream_fetched_at,
+            },
         }
 
         return matrix
@@ -810,58 +1337,74 @@ class VersionMatrixExtractor:
         """Extract external Kurtosis package pins from the kurtosis.yml replace block."""
         packages = {}
 
-        try:
-            with open(self.kurtosis_yaml_path, 'r') as f:
-                kurtosis_yaml = yaml.safe_load(f)
-        except Exception as e:
-            print(f"Error reading {self.kurtosis_yaml_path}: {e}")
-            return packages
-
-        replace_options = (kurtosis_yaml or {}).get('replace') or {}
+        replace_options = self._load_replace_options()
         if not replace_options:
             print("No `replace` block found in kurtosis.yml, skipping packages.")
             return packages
 
-        for package_locator, replacement in replace_options.items():
-            # A replacement may redirect to a different repo (e.g. a fork) and
-            # optionally append `@<tag|branch|commit>`. The pin is what actually
-            # gets resolved, so report against the replacement target.
-            target, _, pin = replacement.partition('@')
-            repo = self._repo_from_locator(target)
-            if not repo:
-                print(f"Could not derive a GitHub repo from '{target}', skipping.")
-                continue
+        # Packages are independent of each other, resolve them concurrently.
+        with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as executor:
+            results = executor.map(
+                lambda item: (item[0], self._extract_package(*item)),
+                replace_options.items())
+            for package_locator, package in results:
+                if package:
+                    packages[package_locator] = package
 
-            pin = pin or 'HEAD'
-            pin_date = self._get_ref_date(repo, pin)
-            tracking_mode = PACKAGE_TRACKING_MODE.get(package_locator, 'release')
+        return packages
 
-            if tracking_mode == 'head':
-                latest_version, latest_version_date = self._get_head_version(repo)
-                status, commit_distance = self._determine_head_tracked_status(
-                    repo, pin, pin_date, latest_version)
-            else:
-                latest_version, latest_version_date = self._get_latest_package_version(repo)
-                status, commit_distance = self._determine_package_status(
-                    repo, pin, pin_date, latest_version, latest_version_date)
-
-            packages[package_locator] = PackageVersion(
-                pin=pin,
-                pin_date=pin_date,
-                pin_source_url=self._get_package_source_url(repo, pin),
-                latest_version=latest_version,
-                latest_version_date=latest_version_date,
-                latest_version_source_url=(
-                    self._get_package_source_url(repo, latest_version)
-                    if latest_version else None
-                ),
-                status=status,
-                commit_distance=commit_distance,
-                tracking_mode=tracking_mode,
-                pin_reason=PINNED_PACKAGES.get(package_locator),
-            )
+    def _load_replace_options(self) -> Dict[str, str]:
+        """The kurtosis.yml replace block, package locator -> replacement."""
+        try:
+            with open(self.kurtosis_yaml_path, 'r') as f:
+                kurtosis_yaml = yaml.safe_load(f)
+        except Exception as e:
+            print(f"Error reading {self.kurtosis_yaml_path}: {e}")
+            return {}
+        return (kurtosis_yaml or {}).get('replace') or {}
+
+    def _parse_replacement(self, replacement: str) -> tuple:
+        """Return (target, repo, pin) of a replace entry, repo None if unknown."""
+        # A replacement may redirect to a different repo (e.g. a fork) and
+        # optionally append `@<tag|branch|commit>`. The pin is what actually
+        # gets resolved, so report against the replacement target.
+        target, _, pin = replacement.partition('@')
+        return target, self._repo_from_locator(target), pin or 'HEAD'
+
+    def _extract_package(self, package_locator: str, replacement: str) -> Optional[PackageVersion]:
+        """Resolve the pin and latest version of one replaced package."""
+        target, repo, pin = self._parse_replacement(replacement)
+        if not repo:
+            print(f"Could not derive a GitHub repo from '{target}', skipping.")
+            return None
 
-        return packages
+        pin_date = self._get_ref_date(repo, pin)
+        tracking_mode = PACKAGE_TRACKING_MODE.get(package_locator, 'release')
+
+        if tracking_mode == 'head':
+            latest_version, latest_version_date = self._get_head_version(repo)
+            status, commit_distance = self._determine_head_tracked_status(
+                repo, pin, pin_date, latest_version)
+        else:
+            latest_version, latest_version_date = self._get_latest_package_version(repo)
+            status, commit_distance = self._determine_package_status(
+                repo, pin, pin_date, latest_version, latest_version_date)
+
+        return PackageVersion(
+            pin=pin,
+            pin_date=pin_date,
+            pin_source_url=self._get_package_source_url(repo, pin),
+            latest_version=latest_version,
+            latest_version_date=latest_version_date,
+            latest_version_source_url=(
+                self._get_package_source_url(repo, latest_version)
+                if latest_version else None
+            ),
+            status=status,
+            commit_distance=commit_distance,
+            tracking_mode=tracking_mode,
+            pin_reason=PINNED_PACKAGES.get(package_locator),
+        )
 
     def _repo_from_locator(self, locator: str) -> Optional[str]:
         """Turn a github.com/org/repo[/sub/path] locator into 'org/repo'."""
@@ -879,31 +1422,32 @@ class VersionMatrixExtractor:
         from /releases/latest, and logging that as an error is just noise.
         """
         try:
-            response = requests.get(
-                f"https://api.github.com/{path}", timeout=10,
-                headers={'Authorization': f'token {os.getenv("GITHUB_TOKEN")}'})
-            if response.status_code == 200:
-                return response.json()
-            if response.status_code == 404 and allow_missing:
+            status_code, data = self._fetch_json(f"https://api.github.com/{path}")
+            if status_code == 200:
+                return data
+            if status_code == 404 and allow_missing:
                 return None
-            print(f"Error fetching {path}: {response.status_code}")
+            print(f"Error fetching {path}: {status_code}")
         except Exception as e:
             print(f"Error fetching {path}: {e}")
         return None
 
-    def _get_ref_date(self, repo: str, ref: str) -> Optional[str]:
-        """Resolve the commit date (YYYY-MM-DD) of a tag, branch or commit."""
-        if not ref:
-            return None
-
+    def _ref_candidates(self, ref: str) -> List[str]:
+        """Spellings of a ref to try, in order."""
         candidates = [ref]
         # Kurtosis pins are often written `@v1.1.0` while the upstream tag is
         # `1.1.0` (or the reverse), so try both spellings before giving up.
         if not self._is_commit_sha(ref):
             stripped = ref.lstrip('v')
             candidates += [stripped, f"v{stripped}"]
+        return list(dict.fromkeys(candidates))
 
-        for candidate in dict.fromkeys(candidates):
+    def _get_ref_date(self, repo: str, ref: str) -> Optional[str]:
+        """Resolve the commit date (YYYY-MM-DD) of a tag, branch or commit."""
+        if not ref:
+            return None
+
+        for candidate in self._ref_candidates(ref):
             data = self._github_get(f"repos/{repo}/commits/{candidate}")
             if data:
                 date = data.get('commit', {}).get('committer', {}).get('date')
@@ -1039,6 +1583,17 @@ class VersionMatrixExtractor:
 
         return None, None
 
+    def load_matrix_json(self, path: Optional[Path] = None) -> Optional[Dict]:
+        """Load the previous matrix, if any, for an incremental rebuild."""
+        if path is None:
+            path = f"{self.repo_root}/scripts/version-matrix/matrix.json"
+
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
     def save_matrix_json(self, matrix: Dict, output_path: Optional[Path] = None):
         """Save matrix as JSON file."""
         if output_path is None:
@@ -1052,17 +1607,35 @@ class VersionMatrixExtractor:
 
 def main():
     """Main execution function."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--offline', action='store_true',
+        help="Build the matrix from cached GitHub responses only")
+    parser.add_argument(
+        '--cache-dir', type=Path, default=DEFAULT_HTTP_CACHE_DIR,
+        help=f"GitHub responses cache (default: {DEFAULT_HTTP_CACHE_DIR})")
+    parser.add_argument(
+        '--graphql', action='store_true',
+        help="Resolve releases, tags and commits with batched GraphQL queries")
+    parser.add_argument(
+        '--full', action='store_true',
+        help="Rebuild everything, even what only depends on unchanged inputs")
+    args = parser.parse_args()
+
     # Check if GITHUB_TOKEN is set
-    if not os.getenv('GITHUB_TOKEN'):
+    if not args.offline and not os.getenv('GITHUB_TOKEN'):
         print("Error: GITHUB_TOKEN environment variable is not set.")
         print("Please set it to access GitHub API for version information.")
         exit(1)
 
     repo_root = Path(__file__).parent.parent.parent
-    extractor = VersionMatrixExtractor(repo_root)
+    extractor = VersionMatrixExtractor(
+        repo_root, http_cache=HTTPCache(args.cache_dir), offline=args.offline,
+        graphql=args.graphql)
 
     print("Starting version matrix extraction...")
-    matrix = extractor.generate_version_matrix()
+    previous = None if args.full else extractor.load_matrix_json()
+    matrix = extractor.generate_version_matrix(previous)
     extractor.save_matrix_json(matrix)
 
     # Print summary
@@ -1072,6 +1645,7 @@ def main():
     print(f"Total Packages: {summary['total_packages']}")
     print(f"Total Test environments: {summary['environments']['total']}")
     print(f"Matrix generated at: {matrix['generated_at']}")
+    extractor.github.print_timings()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Tests for the version matrix extraction tool.
+
+Run them with: python3 -m unittest discover scripts/version-matrix
+"""
+
+import contextlib
+import hashlib
+import http.server
+import importlib.util
+import json
+import random
+import re
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+
+spec = importlib.util.spec_from_file_location(
+    "extract_versions", Path(__file__).parent / "extract-versions.py")
+extract_versions = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(extract_versions)
+
+Version = extract_versions.Version
+version_status = extract_versions.version_status
+
+# Properties are checked against versions generated from a fixed seed, so a
+# failure always reproduces.
+SEED = 20251018
+SAMPLES = 300
+
+PRERELEASE_IDENTIFIERS = ["alpha", "beta", "rc", "0", "1", "2", "9", "11"]
+
+
+def random_version(rng: random.Random) -> str:
+    version = ".".join(str(rng.randint(0, 3)) for _ in range(rng.choice([1, 2, 3, 3, 3, 4])))
+    if rng.random() < 0.5:
+        version += "-" + ".".join(
+            rng.choice(PRERELEASE_IDENTIFIERS) for _ in range(rng.randint(1, 3)))
+    if rng.random() < 0.2:
+        version += "+build." + str(rng.randint(0, 9))
+    return rng.choice(["", "v"]) + version
+
+
+class VersionTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(SEED)
+        self.versions = [random_version(rng) for _ in range(SAMPLES)]
+
+    def test_semver_precedence(self):
+        # Example from https://semver.org/#spec-item-11
+        ordered = [
+            "1.0.0-alpha", "1.0.0-alpha.1", "1.0.0-alpha.beta", "1.0.0-beta",
+            "1.0.0-beta.2", "1.0.0-beta.11", "1.0.0-rc.1", "1.0.0",
+        ]
+        parsed = [Version.parse(v) for v in ordered]
+        self.assertEqual(sorted(parsed), parsed)
+        for lower, higher in zip(ordered, ordered[1:]):
+            self.assertEqual(version_status(lower, higher), "behind stable")
+            self.assertEqual(version_status(higher, lower), "newer than stable")
+
+    def test_lenient_forms(self):
+        self.assertEqual(Version.parse("v1"), Version.parse("1.0.0"))
+        self.assertEqual(Version.parse("1.2.3.0"), Version.parse("1.2.3"))
+        self.assertEqual(Version.parse("0.6.4-RC2"), Version.parse("0.6.4-rc.2"))
+        self.assertEqual(version_status("1.2.3.4", "1.2.3"), "newer than stable")
+        self.assertEqual(version_status("1.2.3.4", "1.2.4"), "behind stable")
+        self.assertEqual(version_status("0.6.4-RC2", "0.6.4-rc.2"), "matches stable")
+        self.assertEqual(version_status("0.6.4-RC2", "0.6.4"), "behind stable")
+        for tag in ["latest", "main", "3f2a9c1d", ""]:
+            self.assertIsNone(Version.parse(tag))
+            self.assertEqual(version_status(tag, "1.0.0"), "behind stable")
+
+    def test_total_order(self):
+        parsed = [Version.parse(v) for v in self.versions]
+        for a in parsed:
+            self.assertIsNotNone(a)
+            self.assertEqual(a, a)
+        ordered = sorted(parsed)
+        for a, b in zip(ordered, ordered[1:]):
+            self.assertLessEqual(a, b)
+            self.assertFalse(b < a)
+        rng = random.Random(SEED)
+        for _ in range(SAMPLES):
+            a, b, c = rng.sample(parsed, 3)
+            if a <= b and b <= c:
+                self.assertLessEqual(a, c)
+            if a == b:
+                self.assertEqual(hash(a), hash(b))
+            self.assertEqual(a == b, not (a < b or b < a))
+
+    def test_status_is_antisymmetric(self):
+        opposite = {
+            "behind stable": "newer than stable",
+            "newer than stable": "behind stable",
+            "matches stable": "matches stable",
+        }
+        rng = random.Random(SEED)
+        for _ in range(SAMPLES):
+            a, b = rng.sample(self.versions, 2)
+            self.assertEqual(version_status(b, a), opposite[version_status(a, b)], (a, b))
+
+    def test_build_metadata_is_ignored(self):
+        for version in self.versions:
+            release = version.partition("+")[0]
+            self.assertEqual(Version.parse(version), Version.parse(release + "+other.1"))
+            self.assertEqual(version_status(version, release), "matches stable")
+
+    def test_suffix_rules(self):
+        for version in self.versions:
+            release = Version.parse(version).release
+            tag = f"{release.major}.{release.minor}.{release.patch}"
+            if release.revision or Version.parse(version).prerelease:
+                continue
+            self.assertEqual(version_status(f"v{tag}-agglayer", f"v{tag}", "op-succinct-proposer"),
+                             "matches stable")
+            self.assertEqual(version_status(f"v{tag}-cdk", f"v{tag}", "op-deployer"), "matches stable")
+            # Without a rule, the suffix is a plain prerelease
+            self.assertEqual(version_status(f"v{tag}-cdk", f"v{tag}"), "behind stable")
+            self.assertEqual(
+                version_status(f"v{tag}-rc.1-aggchain.multisig", f"v{tag}", "agglayer-contracts"),
+                "newer than stable")
+
+
+class StubGitHub(http.server.BaseHTTPRequestHandler):
+    """Serves the JSON bodies of the server's routes, with an ETag each."""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path not in self.server.routes:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag, data = self.server.routes[self.path]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubGitHub)
+        self.server.routes = {'/release': ('"v1"', {'tag_name': 'v1.0.0'})}
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = extract_versions.HTTPCache(Path(cache_dir.name))
+
+    def fetch_json(self, path, offline=False):
+        # A new extractor per call, as the responses are memoized for a run
+        extractor = extract_versions.VersionMatrixExtractor(
+            Path(__file__).parents[2], http_cache=self.cache, offline=offline)
+        return extractor._fetch_json(self.url + path)
+
+    def test_revalidation(self):
+        self.assertEqual(self.fetch_json('/release'), (200, {'tag_name': 'v1.0.0'}))
+        self.assertEqual(self.server.requests, [('/release', None)])
+
+        # Same ETag, so the server answers 304 and the body comes from the cache
+        self.server.routes['/release'] = ('"v1"', {'tag_name': 'not served'})
+        self.assertEqual(self.fetch_json('/release'), (200, {'tag_name': 'v1.0.0'}))
+        self.assertEqual(self.server.requests[1:], [('/release', '"v1"')])
+
+        # A new ETag replaces the cached entry
+        self.server.routes['/release'] = ('"v2"', {'tag_name': 'v2.0.0'})
+        self.assertEqual(self.fetch_json('/release'), (200, {'tag_name': 'v2.0.0'}))
+        self.assertEqual(self.fetch_json('/release', offline=True), (200, {'tag_name': 'v2.0.0'}))
+        self.assertEqual(self.server.requests[2:], [('/release', '"v1"')])
+
+    def test_not_found_is_cached(self):
+        self.assertEqual(self.fetch_json('/missing'), (404, None))
+        self.assertEqual(self.fetch_json('/missing', offline=True), (404, None))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_offline_with_cold_cache(self):
+        self.assertEqual(self.fetch_json('/release', offline=True), (None, None))
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(list(self.cache.cache_dir.iterdir()), [])
+
+
+# Repos served by FakeGitHub: latest release, releases and tags with their
+# commit dates, newest first
+FAKE_REPOS = {
+    "0xPolygon/zkevm-prover": {
+        "release": None,
+        "releases": [],
+        # v6.0.8 is a backport, committed after v8.0.0
+        "tags": {"v9.0.0": "2025-01-01", "v8.0.0-RC1": "2025-02-01",
+                 "v8.0.0": "2025-03-01", "v6.0.8": "2025-06-01"},
+    },
+    "ethereum-optimism/optimism": {
+        "release": ("op-node/v1.13.0", "2025-05-01T00:00:00Z"),
+        "releases": ["op-node/v1.14.0-rc.1", "op-batcher/v1.12.0", "op-node/v1.13.0"],
+        "tags": {"op-node/v1.13.0": "2025-05-01", "op-batcher/v1.12.0": "2025-04-01"},
+    },
+    "example/package": {
+        "release": None,
+        "releases": [],
+        "tags": {"v1.0.0": "2025-01-01", "v0.9.0": "2025-02-01"},
+    },
+}
+FAKE_HEAD_DATE = "2025-07-01"
+
+
+def fake_commit(repo, ref, date):
+    sha = hashlib.sha1(f"{repo}@{ref}".encode()).hexdigest()
+    return {"sha": sha, "commit": {"committer": {"date": f"{date}T00:00:00Z"}}}
+
+
+class FakeGitHub(http.server.BaseHTTPRequestHandler):
+    """The REST and GraphQL endpoints the extraction uses, over FAKE_REPOS."""
+
+    def _send(self, status, data=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        match = re.fullmatch(r'/repos/([^/]+/[^/]+)/([^?]+)(?:\?(.*))?', self.path)
+        repo = FAKE_REPOS.get(match.group(1)) if match else None
+        if repo is None:
+            return self._send(404)
+        name, endpoint, query = match.group(1), match.group(2), match.group(3)
+        # REST lists tags by name
+        tags = sorted(repo["tags"], reverse=True)
+        if endpoint == "releases/latest" and repo["release"]:
+            tag_name, published_at = repo["release"]
+            return self._send(200, {"tag_name": tag_name, "published_at": published_at})
+        if endpoint == "releases":
+            return self._send(200, [{"tag_name": t} for t in repo["releases"]])
+        if endpoint == "tags":
+            return self._send(200, [{"name": t} for t in tags[:1 if query == "per_page=1" else None]])
+        if endpoint == "commits" and query == "per_page=1":
+            return self._send(200, [fake_commit(name, "HEAD", FAKE_HEAD_DATE)])
+        if endpoint.startswith("commits/") and endpoint[8:] in repo["tags"]:
+            ref = endpoint[8:]
+            return self._send(200, fake_commit(name, ref, repo["tags"][ref]))
+        if endpoint.startswith("compare/"):
+            return self._send(200, {"ahead_by": 0, "behind_by": 1})
+        self._send(404)
+
+    def do_POST(self):
+        self.server.requests.append(self.path)
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['query']
+        data = {}
+        repos = list(re.finditer(
+            r'(repo\d+): repository\(owner: "([^"]+)", name: "([^"]+)"\)', query))
+        for match, following in zip(repos, repos[1:] + [None]):
+            fields = query[match.end():following.start() if following else None]
+            name = f"{match.group(2)}/{match.group(3)}"
+            repo = FAKE_REPOS.get(name)
+            if repo is None:
+                data[match.group(1)] = None
+                continue
+            node = data[match.group(1)] = {"latestRelease": repo["release"] and {
+                "tagName": repo["release"][0], "publishedAt": repo["release"][1]}}
+
+            def target(ref, date):
+                commit = fake_commit(name, ref, date)
+                return {"oid": commit["sha"], "committedDate": f"{date}T00:00:00Z"}
+            if "releases(" in fields:
+                node["releases"] = {"nodes": [{"tagName": t} for t in repo["releases"]]}
+            if "tags: refs(" in fields:
+                by_date = sorted(repo["tags"].items(), key=lambda t: t[1], reverse=True)
+                node["tags"] = {"nodes": [
+                    {"name": t, "target": target(t, date)} for t, date in by_date]}
+            if "defaultBranchRef" in fields:
+                node["defaultBranchRef"] = {"target": target("HEAD", FAKE_HEAD_DATE)}
+            for alias, ref in re.findall(r'(ref\d+): object\(expression: "([^"]+)"\)', fields):
+                date = repo["tags"].get(ref)
+                node[alias] = target(ref, date) if date else None
+        self._send(200, {"data": data})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubSession(requests.Session):
+    """Session sending the GitHub API requests to a stub server."""
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def request(self, method, url, *args, **kwargs):
+        url = url.replace("https://api.github.com", self.url)
+        return super().request(method, url, *args, **kwargs)
+
+
+class GraphQLTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeGitHub)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def extract(self, graphql):
+        extractor = extract_versions.VersionMatrixExtractor(
+            Path(__file__).parents[2], graphql=graphql)
+        extractor.github.session = StubSession(f"http://127.0.0.1:{self.server.server_port}")
+        extractor.repos = {
+            "zkevm-prover": "0xPolygon/zkevm-prover",
+            "op-node": "ethereum-optimism/optimism",
+        }
+        replace_options = {"github.com/example/package": "github.com/example/package@v0.9.0"}
+        extractor._load_replace_options = lambda: replace_options
+        if graphql:
+            extractor.prefetch_graphql()
+        versions = {c: extractor._get_latest_version(c) for c in extractor.repos}
+        packages = {
+            locator: extractor._extract_package(locator, replacement)
+            for locator, replacement in replace_options.items()
+        }
+        return versions, packages
+
+    def test_graphql_matches_rest(self):
+        rest = self.extract(graphql=False)
+        rest_requests, self.server.requests = self.server.requests, []
+        graphql = self.extract(graphql=True)
+
+        self.assertEqual(rest[0], {"zkevm-prover": "8.0.0", "op-node": "1.13.0"})
+        self.assertEqual(rest[1]["github.com/example/package"].latest_version, "v1.0.0")
+        self.assertEqual(graphql, rest)
+        self.assertIn("/graphql", self.server.requests)
+        self.assertLess(len(self.server.requests), len(rest_requests))
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = extract_versions.HTTPCache(Path(cache_dir.name))
+        self.previous = self.generate()[0]
+
+    def generate(self, previous=None):
+        """Returns the matrix and the components whose latest version was resolved."""
+        extractor = extract_versions.VersionMatrixExtractor(
+            Path(__file__).parents[2], http_cache=self.cache, offline=True)
+        resolved = []
+        extractor._resolve_latest_version = lambda component: resolved.append(component) or "1.0.0"
+        with contextlib.redirect_stdout(None):
+            matrix = extractor.generate_version_matrix(previous)
+        return matrix, resolved, extractor
+
+    def test_unchanged(self):
+        self.previous['generated_at'] = (datetime.now() - timedelta(hours=1)).isoformat()
+        matrix, resolved, _ = self.generate(self.previous)
+        self.assertEqual(resolved, [])
+        self.assertGreater(matrix['generated_at'], self.previous['generated_at'])
+        self.assertEqual({**matrix, 'generated_at': None}, {**self.previous, 'generated_at': None})
+
+    def test_changed_test_file(self):
+        environments = self.previous['test_environments']
+        changed, unchanged = list(environments)[:2]
+        extractor = self.generate()[2]
+        path = dict(extractor.test_files_paths)[changed]
+        self.previous['inputs']['hashes'][extractor._relative_path(path)] = "outdated"
+        rebuilt = environments[changed]
+        environments[unchanged] = {**environments[unchanged], 'sentinel': True}
+        self.previous['packages'] = {'sentinel': True}
+
+        matrix, resolved, _ = self.generate(self.previous)
+        # Latest versions come from the previous matrix
+        self.assertEqual(resolved, [])
+        self.assertEqual(matrix['test_environments'][changed], rebuilt)
+        self.assertEqual(matrix['test_environments'][unchanged], environments[unchanged])
+        self.assertEqual(matrix['packages'], {'sentinel': True})
+        self.assertEqual(matrix['inputs']['upstream_fetched_at'],
+                         self.previous['inputs']['upstream_fetched_at'])
+        self.assertNotEqual(matrix['inputs']['hashes'], self.previous['inputs']['hashes'])
+
+    def test_expired_upstream(self):
+        fetched_at = datetime.now() - timedelta(hours=extract_versions.UPSTREAM_MAX_AGE_HOURS + 1)
+        self.previous['inputs']['upstream_fetched_at'] = fetched_at.isoformat()
+        self.previous['packages'] = {'sentinel': True}
+
+        matrix, resolved, _ = self.generate(self.previous)
+        self.assertNotEqual(resolved, [])
+        self.assertNotEqual(matrix['packages'], {'sentinel': True})
+        self.assertGreater(matrix['inputs']['upstream_fetched_at'], fetched_at.isoformat())
+
+
+class DefaultImagesTest(unittest.TestCase):
+    def test_suffix_rules_apply_to_default_images(self):
+        extractor = extract_versions.VersionMatrixExtractor(Path(__file__).parents[2], offline=True)
+        # Every component's latest release is the one its default image is built on
+        extractor._get_latest_version = lambda component: "v3.10.0"
+        extractor._get_source_url = lambda component, version: None
+        components = extractor.extract_default_images()
+        self.assertEqual(components["op-succinct-proposer"].version, "3.10.0-agglayer")
+        self.assertEqual(components["op-succinct-proposer"].status, "matches stable")
+
+
+if __name__ == "__main__":
+    unittest.main()
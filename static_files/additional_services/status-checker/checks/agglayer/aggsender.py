@@ -1,79 +1,92 @@
 #!/usr/bin/env python3
 
-import sqlite3
-import json
-import urllib.request
+# Checks that the latest certificates in the aggsender database match what
+# the agglayer knows about them, and tracks how long certificates spend in
+# each status.
+
+import asyncio
 import os
 import sys
 
-consensus_type = os.getenv("CONSENSUS_CONTRACT_TYPE")
-args = ["pessimistic", "fep"]
-if consensus_type not in args:
-    print(f"Skipping check, consensus must be one of: {', '.join(args)}")
-    sys.exit(0)
-
-CertificateStatus = {
-    0: "Pending",
-    1: "Proven",
-    2: "Candidate",
-    3: "InError",
-    4: "Settled",
-}
-
-agglayer_rpc_url = os.getenv("AGGLAYER_RPC_URL")
-if not agglayer_rpc_url:
-    raise ValueError("ERROR: No AGGLAYER_RPC_URL is set")
-
-request = urllib.request.Request(
-    agglayer_rpc_url,
-    method="POST",
-    headers={"Content-Type": "application/json"},
-    data=json.dumps(
-        {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "interop_getLatestKnownCertificateHeader",
-            "params": [1],
-        }
-    ).encode("utf-8"),
-)
-
-with urllib.request.urlopen(request) as response:
-    response_text = response.read().decode("utf-8")
-
-header = json.loads(response_text)["result"]
-if header is None:
-    sys.exit(0)
-
-certificate_id = header["certificate_id"]
-
-conn = sqlite3.connect("/opt/aggkit/aggsender.sqlite")
-cursor = conn.cursor()
-
-table_name = "certificate_info"
-cursor.execute(f"PRAGMA table_info({table_name});")
-columns = [col[1] for col in cursor.fetchall()]
-
-cursor.execute(f"SELECT * FROM {table_name} WHERE certificate_id='{certificate_id}';")
-row = cursor.fetchone()
-row_dict = dict(zip(columns, row))
-
-assert header["height"] == row_dict["height"], (
-    f"ERROR: {header['height']} != {row_dict['height']}"
-)
-
-assert header["prev_local_exit_root"] == row_dict["previous_local_exit_root"], (
-    f"ERROR: {header['prev_local_exit_root']} != {row_dict['previous_local_exit_root']}"
-)
-
-assert header["new_local_exit_root"] == row_dict["new_local_exit_root"], (
-    f"ERROR: {header['new_local_exit_root']} != {row_dict['new_local_exit_root']}"
-)
-
-status = CertificateStatus[row_dict["status"]]
-assert header["status"] == status, f"ERROR: {header['status']} != {status}"
-
-signed_certificate = json.loads(row_dict["signed_certificate"])
-assert header["metadata"] == signed_certificate["metadata"], (
-    f"ERROR: {header['metadata']} != {signed_certificate['metadata']}"
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from aggsender_db import AggsenderDB  # noqa: E402
+from certificate_timeline import CertificateTimeline  # noqa: E402
+from jsonrpc import AsyncClient, RPCError  # noqa: E402
+from lib import certificate_status, check_consensus, get_network_id  # noqa: E402
+from state import StateStore  # noqa: E402
+
+check_consensus("pessimistic", "fep")
+
+# Number of most recent certificates verified on each run
+WINDOW = 10
+
+
+def is_not_found(error):
+    """Whether an agglayer lookup failed because it doesn't know the resource."""
+    return isinstance(error, RPCError) and "not found" in str(error).lower()
+
+
+def compare(header, certificate):
+    """Differences between an agglayer certificate header and an aggsender certificate."""
+    expected = {
+        "height": certificate["height"],
+        "prev_local_exit_root": certificate["previous_local_exit_root"],
+        "new_local_exit_root": certificate["new_local_exit_root"],
+        "status": certificate["status"],
+        "metadata": (certificate["signed_certificate"] or {}).get("metadata"),
+    }
+    actual = {**header, "status": certificate_status(header["status"])}
+    return [
+        f"ERROR: certificate {certificate['certificate_id']} {field}: {actual[field]} != {value}"
+        for field, value in expected.items()
+        if actual[field] != value
+    ]
+
+
+async def main():
+    agglayer_rpc_url = os.getenv("AGGLAYER_RPC_URL")
+    if not agglayer_rpc_url:
+        raise ValueError("ERROR: No AGGLAYER_RPC_URL is set")
+
+    with StateStore() as store:
+        async with AsyncClient(os.getenv("L2_RPC_URL")) as l2, AsyncClient(agglayer_rpc_url) as agglayer:
+            network_id = await get_network_id(l2, store)
+            latest = await agglayer.call("interop_getLatestKnownCertificateHeader", network_id)
+            if latest is None:
+                return 0
+
+            with AggsenderDB(store) as db:
+                certificates = db.latest_certificates(WINDOW)
+                if latest["certificate_id"] not in {c["certificate_id"] for c in certificates}:
+                    latest_certificate = db.certificate(latest["certificate_id"])
+                    if latest_certificate is None:
+                        print(f"ERROR: certificate {latest['certificate_id']} is not in the aggsender database")
+                        return 1
+                    certificates.insert(0, latest_certificate)
+
+            # One failed lookup must not hide the others
+            headers = await asyncio.gather(*(
+                agglayer.call("interop_getCertificateHeader", c["certificate_id"]) for c in certificates
+            ), return_exceptions=True)
+
+        timeline = CertificateTimeline(store)
+        timeline.update([header for header in headers if isinstance(header, dict)])
+        for status, percentiles in timeline.update_dwell_metrics().items():
+            print(f"{status} dwell time: " + " ".join(f"p{q * 100:g}={s:.0f}s" for q, s in percentiles.items()))
+
+    errors = []
+    for header, certificate in zip(headers, certificates):
+        if header is None or is_not_found(header):
+            errors.append(f"ERROR: certificate {certificate['certificate_id']} is unknown to the agglayer")
+        elif isinstance(header, Exception):
+            errors.append(f"ERROR: certificate {certificate['certificate_id']}: {header}")
+        else:
+            errors += compare(header, certificate)
+
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
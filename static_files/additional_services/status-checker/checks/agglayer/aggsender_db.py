@@ -0,0 +1,84 @@
+# This module defines a read-only accessor for the aggsender database used by
+# the aggsender checks. It does NOT include a shebang so that the
+# status-checker skips executing this file directly.
+
+import json
+import sqlite3
+
+AGGSENDER_DB = "/opt/aggkit/aggsender.sqlite"
+
+CertificateStatus = {
+    0: "Pending",
+    1: "Proven",
+    2: "Candidate",
+    3: "InError",
+    4: "Settled",
+}
+
+# Columns of certificate_info the checks compare against the agglayer
+CERTIFICATE_COLUMNS = [
+    "certificate_id",
+    "height",
+    "previous_local_exit_root",
+    "new_local_exit_root",
+    "status",
+    "signed_certificate",
+]
+
+
+class AggsenderDB:
+    """Read-only view of the aggsender database.
+
+    The database is opened with `mode=ro`, so the check never takes a write
+    lock against the aggsender writing under load, and in WAL mode readers
+    don't block the writer either. Queries are parameterized and only select
+    the columns the checks need, which are validated against a schema cached
+    until the database schema_version changes.
+    """
+
+    def __init__(self, store, path=AGGSENDER_DB):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+        self.conn.row_factory = sqlite3.Row
+        self.columns = self._certificate_columns(store)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+    def _certificate_columns(self, store):
+        schema_version = self.conn.execute("PRAGMA schema_version").fetchone()[0]
+        cache = store.get("aggsender.schema")
+        if cache and cache["schema_version"] == schema_version:
+            columns = cache["columns"]
+        else:
+            columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(certificate_info)")]
+            store.set("aggsender.schema", {"schema_version": schema_version, "columns": columns})
+
+        missing = [column for column in CERTIFICATE_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(f"ERROR: certificate_info is missing columns: {', '.join(missing)}")
+        return CERTIFICATE_COLUMNS
+
+    def _certificate(self, row):
+        certificate = dict(row)
+        certificate["status"] = CertificateStatus[certificate["status"]]
+        certificate["signed_certificate"] = json.loads(certificate["signed_certificate"] or "null")
+        return certificate
+
+    def certificate(self, certificate_id):
+        """The certificate with the given id, or None."""
+        row = self.conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM certificate_info WHERE certificate_id = ?",
+            (certificate_id,),
+        ).fetchone()
+        return self._certificate(row) if row else None
+
+    def latest_certificates(self, count):
+        """The count certificates with the highest heights, highest first."""
+        rows = self.conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM certificate_info ORDER BY height DESC LIMIT ?",
+            (count,),
+        )
+        return [self._certificate(row) for row in rows]
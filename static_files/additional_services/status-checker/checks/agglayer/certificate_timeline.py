@@ -0,0 +1,107 @@
+# This module tracks how long certificates spend in each status, for the
+# aggsender checks. It does NOT include a shebang so that the status-checker
+# skips executing this file directly.
+
+import math
+import time
+
+from aggsender_db import CertificateStatus
+from lib import certificate_status
+from metrics import delete_metric, set_gauge
+from state import HISTORY_SECONDS
+
+# Window the dwell-time percentiles are computed over
+DWELL_WINDOW_SECONDS = 60 * 60
+
+DWELL_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def quantile(values, q):
+    """Nearest-rank quantile of sorted values."""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class CertificateTimeline:
+    """First time each certificate was seen in each status.
+
+    Rows are only ever inserted, one per certificate and status, and pruned
+    along with the rest of the state history. A status counts as entered at
+    the time it was first seen only if the certificate was tracked on a
+    previous run, otherwise the tracker started while it was already in it.
+    The time spent in a status is then the time until the next one was first
+    seen, so its accuracy is the check interval.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        store.conn.execute("""
+            CREATE TABLE IF NOT EXISTS certificate_timeline (
+                certificate_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                first_seen_at REAL NOT NULL,
+                entered INTEGER NOT NULL,
+                PRIMARY KEY (certificate_id, status)
+            ) WITHOUT ROWID
+        """)
+
+    def update(self, headers):
+        """Records the statuses of the given agglayer certificate headers."""
+        now = time.time()
+        with self.store.transaction():
+            tracking = self.store.get("certificate.timeline.updated_at") is not None
+            for header in headers:
+                tracked = self.store.conn.execute(
+                    "SELECT 1 FROM certificate_timeline WHERE certificate_id = ?",
+                    (header["certificate_id"],),
+                ).fetchone()
+                self.store.conn.execute(
+                    "INSERT OR IGNORE INTO certificate_timeline VALUES (?, ?, ?, ?)",
+                    (header["certificate_id"], certificate_status(header["status"]), now, int(tracking or bool(tracked))),
+                )
+            self.store.conn.execute(
+                "DELETE FROM certificate_timeline WHERE first_seen_at < ?", (now - HISTORY_SECONDS,)
+            )
+            self.store.set("certificate.timeline.updated_at", now)
+
+    def dwell_times(self, since):
+        """Seconds spent in each status by certificates that left it since the given time."""
+        rows = self.store.conn.execute("""
+            SELECT status, left_at - first_seen_at FROM (
+                SELECT status, first_seen_at, entered, LEAD(first_seen_at) OVER (
+                    PARTITION BY certificate_id ORDER BY first_seen_at
+                ) AS left_at
+                FROM certificate_timeline
+            )
+            WHERE entered AND left_at >= ?
+        """, (since,))
+        dwell_times = {}
+        for status, seconds in rows:
+            dwell_times.setdefault(status, []).append(seconds)
+        return {status: sorted(seconds) for status, seconds in dwell_times.items()}
+
+    def update_dwell_metrics(self, window=DWELL_WINDOW_SECONDS):
+        """Exports the dwell-time percentiles of each status over the window, and returns them."""
+        dwell_times = self.dwell_times(time.time() - window)
+        percentiles = {}
+        with self.store.transaction():
+            for status in CertificateStatus.values():
+                seconds = dwell_times.get(status)
+                if not seconds:
+                    # Don't keep exporting percentiles that are out of the window
+                    delete_metric(self.store, "certificate_dwell_count", status=status)
+                    for q in DWELL_QUANTILES:
+                        delete_metric(self.store, "certificate_dwell_seconds", status=status, quantile=str(q))
+                    continue
+
+                set_gauge(
+                    self.store, "certificate_dwell_count", len(seconds),
+                    "Certificates that left a status over the last hour.", status=status,
+                )
+                percentiles[status] = {q: quantile(seconds, q) for q in DWELL_QUANTILES}
+                for q, value in percentiles[status].items():
+                    set_gauge(
+                        self.store, "certificate_dwell_seconds", value,
+                        "Seconds certificates spent in a status over the last hour.",
+                        status=status, quantile=str(q),
+                    )
+        return percentiles
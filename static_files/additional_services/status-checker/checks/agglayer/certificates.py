@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Runs the certificate checks (status, and known/pending/settled heights)
+# concurrently. The agglayer calls go out as a single batch request, and the
+# L2 network id is resolved once and then cached.
+
+import asyncio
+import calendar
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jsonrpc import AsyncClient  # noqa: E402
+from lib import certificate_status, check_consensus, get_network_id  # noqa: E402
+from metrics import observe  # noqa: E402
+from state import StateStore  # noqa: E402
+
+check_consensus("pessimistic", "fep")
+
+HEIGHT_METHODS = {
+    "known": "interop_getLatestKnownCertificateHeader",
+    "pending": "interop_getLatestPendingCertificateHeader",
+    "settled": "interop_getLatestSettledCertificateHeader",
+}
+
+
+def check_certificate_status(store, curr):
+    """Fails if the latest known certificate is stuck in a non settled status."""
+    # Skip the check if there hasn't been a certificate at any point.
+    if curr is None:
+        return []
+
+    curr = {**curr, "status": certificate_status(curr["status"])}
+    prev = store.get("certificate.status")
+    if prev is None or curr["certificate_id"] != prev["certificate_id"] or curr["status"] != certificate_status(prev["status"]):
+        store.record("certificate.status", {**curr, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())})
+        return []
+
+    prev_epoch = calendar.timegm(time.strptime(prev["timestamp"], "%Y-%m-%dT%H:%M:%SZ"))
+    diff = int(time.time() - prev_epoch)
+    status = curr["status"].lower()
+
+    if diff > 120 and curr["status"] != "Settled":
+        return [f"ERROR: Certificate is stuck status={status} diff={diff}s"]
+
+    if diff > 300:
+        print(f"WARN: Certificate is stuck status={status} diff={diff}s")
+    return []
+
+
+def check_certificate_height(store, name, curr):
+    """Fails if a new certificate doesn't increase the height (or the epoch for settled ones)."""
+    # Skip the check if there hasn't been a certificate at any point.
+    if curr is None:
+        return []
+
+    prev = store.get(f"certificate.{name}")
+    if prev is None or prev["certificate_id"] != curr["certificate_id"]:
+        store.record(f"certificate.{name}", curr)
+    else:
+        store.set(f"certificate.{name}", curr)
+
+    # Skip the check if there is no previous certificate, or no new one.
+    if prev is None or prev["certificate_id"] == curr["certificate_id"]:
+        return []
+
+    if curr["height"] <= prev["height"]:
+        return [f"ERROR: {name.capitalize()} certificate height not increasing: prev={prev['height']}, curr={curr['height']}"]
+
+    if name == "settled" and curr["epoch_number"] <= prev["epoch_number"]:
+        return [
+            f"ERROR: {name.capitalize()} certificate epoch_number not increasing: "
+            f"prev={prev['epoch_number']}, curr={curr['epoch_number']}"
+        ]
+    return []
+
+
+def update_settle_latency(store, settled):
+    """Observes the time between a newly settled certificate being first known and settled."""
+    history = store.history("certificate.known")
+    known = [i for i, (_, header) in enumerate(history) if header["certificate_id"] == settled["certificate_id"]]
+    # Unknown when the certificate was first known if it already was on the first run
+    if known and known[0] > 0:
+        observe(
+            store, "certificate_settle_seconds", time.time() - history[known[0]][0],
+            "Seconds between a certificate being known to the agglayer (Pending) and settled.",
+        )
+
+
+async def main():
+    agglayer_rpc_url = os.getenv("AGGLAYER_RPC_URL")
+    if not agglayer_rpc_url:
+        raise ValueError("ERROR: No AGGLAYER_RPC_URL is set")
+
+    with StateStore() as store:
+        async with AsyncClient(os.getenv("L2_RPC_URL")) as l2, AsyncClient(agglayer_rpc_url) as agglayer:
+            network_id = await get_network_id(l2, store)
+            headers = dict(zip(HEIGHT_METHODS, await asyncio.gather(*(
+                agglayer.call(method, network_id) for method in HEIGHT_METHODS.values()
+            ))))
+
+        with store.transaction():
+            prev_settled = store.get("certificate.settled")
+            errors = check_certificate_status(store, headers["known"])
+            for name, header in headers.items():
+                errors += check_certificate_height(store, name, header)
+
+            settled = headers["settled"]
+            if settled and (prev_settled is None or prev_settled["certificate_id"] != settled["certificate_id"]):
+                update_settle_latency(store, settled)
+
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,62 @@
+# This module decodes the calldata of the rollup sequencing transactions, so
+# checks don't need a `cast cdd` process per batch. It does NOT include a
+# shebang so that the status-checker skips executing this file directly.
+
+# sequenceBatches((bytes,bytes32,uint64,bytes32)[],uint32,uint64,bytes32,address)
+SEQUENCE_BATCHES_SELECTOR = "b910e0f9"
+# sequenceBatchesValidium((bytes32,bytes32,uint64,bytes32)[],uint32,uint64,bytes32,address,bytes)
+SEQUENCE_BATCHES_VALIDIUM_SELECTOR = "165e8a8d"
+
+WORD = 32
+
+
+def _word(data, offset):
+    return int.from_bytes(data[offset:offset + WORD], "big")
+
+
+def _bytes(data, offset):
+    length = _word(data, offset)
+    return data[offset + WORD:offset + WORD + length]
+
+
+def decode_sequence_batches(input_data):
+    """Decodes sequenceBatches or sequenceBatchesValidium calldata.
+
+    Returns the arguments as a dict, with the batches as a list of dicts. A
+    rollup batch has its `transactions` as bytes, a validium batch has its
+    `transactions_hash` instead.
+    """
+    input_data = input_data.removeprefix("0x")
+    selector, data = input_data[:8], bytes.fromhex(input_data[8:])
+    if selector not in (SEQUENCE_BATCHES_SELECTOR, SEQUENCE_BATCHES_VALIDIUM_SELECTOR):
+        raise ValueError(f"ERROR: Not a sequenceBatches call, selector=0x{selector}")
+    validium = selector == SEQUENCE_BATCHES_VALIDIUM_SELECTOR
+
+    batches = []
+    array = _word(data, 0)
+    for i in range(_word(data, array)):
+        if validium:
+            # Static tuples are encoded in place
+            batch = array + WORD + i * 4 * WORD
+            first = {"transactions_hash": "0x" + data[batch:batch + WORD].hex()}
+        else:
+            # Dynamic tuples are encoded at an offset from the array content
+            batch = array + WORD + _word(data, array + WORD + i * WORD)
+            first = {"transactions": _bytes(data, batch + _word(data, batch))}
+        batches.append({
+            **first,
+            "forced_global_exit_root": "0x" + data[batch + WORD:batch + 2 * WORD].hex(),
+            "forced_timestamp": _word(data, batch + 2 * WORD),
+            "forced_block_hash_l1": "0x" + data[batch + 3 * WORD:batch + 4 * WORD].hex(),
+        })
+
+    decoded = {
+        "batches": batches,
+        "l1_info_tree_leaf_count": _word(data, WORD),
+        "max_sequence_timestamp": _word(data, 2 * WORD),
+        "expected_final_acc_input_hash": "0x" + data[3 * WORD:4 * WORD].hex(),
+        "l2_coinbase": "0x" + data[4 * WORD + 12:5 * WORD].hex(),
+    }
+    if validium:
+        decoded["data_availability_message"] = _bytes(data, _word(data, 5 * WORD))
+    return decoded
@@ -0,0 +1,159 @@
+# This module defines a small JSON-RPC client used by the Python-based status
+# checks. It does NOT include a shebang so that the status-checker skips
+# executing this file directly.
+
+import asyncio
+import json
+import ssl
+import urllib.parse
+
+
+class RPCError(Exception):
+    pass
+
+
+class HTTPError(RPCError):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:200].decode(errors='replace')}")
+        self.status = status
+
+
+class AsyncClient:
+    """JSON-RPC client over a single keep-alive HTTP/1.1 connection.
+
+    Calls made concurrently are sent together as one JSON-RPC batch request,
+    so gathering several calls costs a single round trip.
+    """
+
+    def __init__(self, url, timeout=10):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        self.ssl = ssl.create_default_context() if parsed.scheme == "https" else None
+        self.timeout = timeout
+
+        self._id = 0
+        self._pending = []
+        # Running flushes, referenced until done so they aren't garbage collected
+        self._flushes = set()
+        self._lock = asyncio.Lock()
+        self._reader = None
+        self._writer = None
+        # Falls back to one request per call if the server rejects batches
+        self._batch = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def call(self, method, *params):
+        self._id += 1
+        request = {"jsonrpc": "2.0", "id": self._id, "method": method, "params": list(params)}
+        future = asyncio.get_running_loop().create_future()
+        if not self._pending:
+            # Send once every caller scheduled in this iteration has queued
+            asyncio.get_running_loop().call_soon(self._schedule_flush)
+        self._pending.append((request, future))
+        return await future
+
+    def _schedule_flush(self):
+        task = asyncio.ensure_future(self._flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        futures = {request["id"]: future for request, future in pending}
+        try:
+            async with self._lock:
+                if len(pending) > 1 and self._batch:
+                    try:
+                        responses = await self._post([request for request, _ in pending])
+                    except HTTPError:
+                        responses = None
+                    if not isinstance(responses, list):
+                        self._batch = False
+                if len(pending) == 1 or not self._batch:
+                    responses = [await self._post(request) for request, _ in pending]
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for response in responses:
+            future = futures.pop(response.get("id"), None)
+            if future is None:
+                continue
+            if response.get("error"):
+                error = response["error"]
+                future.set_exception(RPCError(f"{error.get('code')}: {error.get('message')}"))
+            else:
+                future.set_result(response.get("result"))
+        for future in futures.values():
+            future.set_exception(RPCError("Missing response"))
+
+    async def _post(self, payload):
+        body = json.dumps(payload).encode()
+        head = (
+            f"POST {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode()
+
+        # A reused connection may have been closed by the server while idle
+        for reused in (self._writer is not None, False):
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout
+                )
+            try:
+                self._writer.write(head + body)
+                await self._writer.drain()
+                status, response = await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if not reused:
+                    raise
+                continue
+            except BaseException:
+                # The connection may be left halfway through a response
+                await self.close()
+                raise
+
+            if status != 200:
+                raise HTTPError(status, response)
+            return json.loads(response)
+
+    async def _read_response(self):
+        status_line = await self._reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self._reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while size := int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                body += (await self._reader.readexactly(size + 2))[:-2]
+            await self._reader.readuntil(b"\r\n")
+        elif "content-length" in headers:
+            body = await self._reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self._reader.read()
+            headers["connection"] = "close"
+
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, body
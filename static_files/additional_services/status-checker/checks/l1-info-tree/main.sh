@@ -6,28 +6,20 @@ source "../lib.sh"
 
 check_consensus rollup cdk-validium
 
-# Ensure that no more than $last_n_events batches sequenced can be processed
-# within the status-checker check interval.
-last_n_events=10
-rollup_contract=$(jq -r '.rollupAddress' /opt/output/combined.json)
+# Ensure that no more than 10 batches sequenced can be processed within the
+# status-checker check interval.
 virtual_batch_number=$(cast rpc --rpc-url "$L2_RPC_URL" zkevm_virtualBatchNumber | jq -r | cast to-dec)
 
-events=$(
-  cast logs "SequenceBatches(uint64,bytes32)" \
-    --rpc-url "$L1_RPC_URL" \
-    --address "$rollup_contract" \
-    --json | jq -r '.[] | .topics[1]' | tail -n "$last_n_events"
-)
+# Only the blocks added since the last run are scanned, see log_cursor.py.
+batch_numbers=$(python3 "../log_cursor.py")
 
-if [[ -z "$events" ]]; then
+if [[ -z "$batch_numbers" ]]; then
   exit 0
 fi
 
 # Iterate over the sequence batches events because sometimes the batch number is
 # greater than the virtual batch.
-while IFS= read -r hex; do
-  batch_number=$(printf "%s\n" "$hex" | cast to-dec)
-
+while IFS= read -r batch_number; do
   if [[ "$batch_number" -gt "$virtual_batch_number" ]]; then
     continue
   fi
@@ -71,4 +63,4 @@ while IFS= read -r hex; do
     fi
   done <<< "$indexes"
 
-done <<< "$events" 
+done <<< "$batch_numbers" 
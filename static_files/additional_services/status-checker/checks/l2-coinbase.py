@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# Checks that the L2 coinbase sequenced on L1 for the most recent batches is
+# the miner of the L2 blocks.
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from calldata import decode_sequence_batches  # noqa: E402
+from jsonrpc import AsyncClient  # noqa: E402
+from lib import check_consensus  # noqa: E402
+from log_cursor import sequenced_batches  # noqa: E402
+from state import StateStore  # noqa: E402
+
+check_consensus("rollup", "cdk-validium")
+
+
+async def main():
+    with StateStore() as store:
+        async with AsyncClient(os.getenv("L1_RPC_URL")) as l1, AsyncClient(os.getenv("L2_RPC_URL")) as l2:
+            # Ensure that no more than 10 batches sequenced can be processed within
+            # the status-checker check interval.
+            batch_numbers, virtual_batch_number, block = await asyncio.gather(
+                sequenced_batches(l1, store, 10),
+                l2.call("zkevm_virtualBatchNumber"),
+                l2.call("eth_getBlockByNumber", "latest", False),
+            )
+
+            # Skip the sequenced batches that are greater than the virtual batch.
+            batch_numbers = [n for n in batch_numbers if n <= int(virtual_batch_number, 16)]
+            batches = await asyncio.gather(*(l2.call("zkevm_getBatchByNumber", n) for n in batch_numbers))
+            txs = await asyncio.gather(*(l1.call("eth_getTransactionByHash", b["sendSequencesTxHash"]) for b in batches))
+
+    miner = block["miner"].lower()
+    for tx in txs:
+        l2_coinbase = decode_sequence_batches(tx["input"])["l2_coinbase"]
+        if miner != l2_coinbase:
+            print(f"ERROR: L2 coinbase mismatch miner={miner} l2_coinbase={l2_coinbase}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,131 @@
+# This file defines common utility functions used by multiple Python-based
+# status checks. It does NOT include a shebang so that the status-checker
+# skips executing this file directly.
+
+import json
+import os
+import sys
+import time
+
+from jsonrpc import AsyncClient
+from metrics import observe, set_gauge
+from state import StateStore
+
+COMBINED_JSON = "/opt/output/combined.json"
+
+# networkID()(uint32)
+NETWORK_ID_SELECTOR = "0xbab161bf"
+
+# Stage each batch goes through before the given one
+PREVIOUS_BATCH_STAGE = {"virtual": "trusted", "verified": "virtual"}
+
+# Window the batch production rate is measured over
+BATCH_RATE_SECONDS = 5 * 60
+
+
+def check_consensus(*args):
+    """Prints a skip notice and exits 0 if the consensus contract type isn't in args."""
+    if os.getenv("CONSENSUS_CONTRACT_TYPE") not in args:
+        print(f"Skipping check, consensus must be one of: {', '.join(args)}")
+        sys.exit(0)
+
+
+def certificate_status(status):
+    """Name of an agglayer certificate status, which is an object for InError."""
+    if isinstance(status, dict):
+        return next(iter(status))
+    return status
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+async def get_network_id(l2, store):
+    """Network id of the L2, cached along with the bridge address it was read from."""
+    l2_rpc_url = os.getenv("L2_RPC_URL")
+    cache = store.get("network")
+    if cache and cache["l2_rpc_url"] == l2_rpc_url:
+        return cache["network_id"]
+
+    l2_bridge_address = read_json(COMBINED_JSON)["polygonZkEVML2BridgeAddress"]
+    result = await l2.call("eth_call", {"to": l2_bridge_address, "data": NETWORK_ID_SELECTOR}, "latest")
+    network_id = int(result, 16)
+    store.set("network", {
+        "l2_rpc_url": l2_rpc_url,
+        "l2_bridge_address": l2_bridge_address,
+        "network_id": network_id,
+    })
+    return network_id
+
+
+async def check_batch(name, rpc_method, threshold=12):
+    """Checks if a batch is stuck.
+
+    name is e.g. "trusted", "verified", or "virtual", and rpc_method e.g.
+    "zkevm_batchNumber", "zkevm_verifiedBatchNumber", or
+    "zkevm_virtualBatchNumber". Fails once the batch number hasn't increased
+    for threshold runs. Returns the exit code.
+    """
+    async with AsyncClient(os.getenv("SEQUENCER_RPC_URL")) as sequencer:
+        batch_number = int(await sequencer.call(rpc_method), 16)
+    print(f"{name.capitalize()} Batch Number: {batch_number}")
+
+    with StateStore() as store, store.transaction():
+        update_batch_metrics(store, name, batch_number)
+
+        prev = store.get(f"batch.{name}", {"batch_number": 0, "idle_counter": 0})
+        if batch_number > prev["batch_number"]:
+            store.set(f"batch.{name}", {"batch_number": batch_number, "idle_counter": 0})
+            store.record(f"batch.{name}.number", batch_number)
+            return 0
+
+        idle_counter = prev["idle_counter"] + 1
+        store.set(f"batch.{name}", {"batch_number": prev["batch_number"], "idle_counter": idle_counter})
+        if idle_counter >= threshold:
+            print(f"ERROR: {name.capitalize()} batch number is stuck")
+            return 1
+        return 0
+
+
+def update_batch_metrics(store, name, batch_number):
+    """Updates the batch number, production rate and lag behind the previous stage."""
+    now = time.time()
+    set_gauge(store, "batch_number", batch_number, "Latest batch number.", batch=name)
+
+    history = store.history(f"batch.{name}.number", since=now - BATCH_RATE_SECONDS)
+    if history and now > history[0][0]:
+        first_recorded_at, first_batch_number = history[0]
+        rate = (batch_number - first_batch_number) / (now - first_recorded_at) * 60
+    else:
+        rate = 0
+    set_gauge(store, "batches_per_minute", rate, "Batch production rate over the last 5 minutes.", batch=name)
+
+    previous_stage = PREVIOUS_BATCH_STAGE.get(name)
+    if not previous_stage:
+        return
+
+    previous = store.get(f"batch.{previous_stage}")
+    if previous:
+        set_gauge(
+            store, "batch_lag", max(0, previous["batch_number"] - batch_number),
+            "Batches the stage is behind the previous one.", **{"from": previous_stage, "to": name},
+        )
+
+    # Time between the previous stage and this one reaching the new batch
+    prev = store.get(f"batch.{name}")
+    if prev and batch_number > prev["batch_number"]:
+        history = store.history(f"batch.{previous_stage}.number")
+        reached = [i for i, (_, n) in enumerate(history) if n >= batch_number]
+        # Unknown if the previous stage already had the batch when first recorded
+        if reached and reached[0] > 0:
+            reached_at = history[reached[0]][0]
+            observe(
+                store, "batch_lag_seconds", now - reached_at,
+                "Seconds between the previous stage and this one reaching a batch.",
+                **{"from": previous_stage, "to": name},
+            )
@@ -0,0 +1,127 @@
+# This module defines a persisted cursor over L1 logs, used by checks that only
+# look at the most recent events of a contract. It does NOT include a shebang
+# so that the status-checker skips executing this file directly.
+#
+# Run it to print the batch numbers of the most recent SequenceBatches events
+# of the rollup contract, oldest first:
+#
+#   python3 log_cursor.py
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from jsonrpc import AsyncClient  # noqa: E402
+from lib import COMBINED_JSON, read_json  # noqa: E402
+from state import StateStore  # noqa: E402
+
+# SequenceBatches(uint64,bytes32)
+SEQUENCE_BATCHES_TOPIC = "0x3e54d0825ed78523037d00a81759237eb436ce774bd546993ee67a1b67b6e766"
+
+# Blocks per eth_getLogs request
+CHUNK_BLOCKS = 2000
+
+# Blocks below the last scanned one scanned again on each update, as they may
+# have been reorged since
+REORG_BLOCKS = 64
+
+
+class LogCursor:
+    """Most recent logs of a contract event, kept up to date incrementally.
+
+    The state stored under key holds the last scanned block and a ring buffer
+    of the `size` most recent events. Each update scans the new blocks backwards from
+    the chain head, one chunk at a time, and stops as soon as the buffer is
+    refilled, so its cost doesn't grow with the chain. The first update stops
+    at from_block.
+
+    The last REORG_BLOCKS blocks are scanned again, and the events kept from
+    them replaced, so logs of blocks orphaned by a reorg don't stay in the
+    buffer.
+    """
+
+    def __init__(self, store, key, address, topic, size=10, from_block=0):
+        self.store = store
+        self.key = key
+        self.address = address.lower()
+        self.topic = topic
+        self.size = size
+
+        state = store.get(key)
+        if state and state["address"] == self.address and state["topic"] == topic:
+            self.last_block = state["last_block"]
+            self.events = state["events"][-size:]
+        else:
+            self.last_block = from_block - 1
+            self.events = []
+
+    async def update(self, l1):
+        latest = int(await l1.call("eth_blockNumber"), 16)
+        # Events up to this block are final, the ones after are scanned again
+        final_block = max(-1, min(self.last_block, latest) - REORG_BLOCKS)
+        new_events = []
+        to_block = latest
+        while to_block > final_block and len(new_events) < self.size:
+            from_block = max(final_block + 1, to_block - CHUNK_BLOCKS + 1)
+            logs = await l1.call("eth_getLogs", {
+                "address": self.address,
+                "topics": [self.topic],
+                "fromBlock": hex(from_block),
+                "toBlock": hex(to_block),
+            })
+            new_events = [
+                {
+                    "block_number": int(log["blockNumber"], 16),
+                    "block_hash": log["blockHash"],
+                    "log_index": int(log["logIndex"], 16),
+                    "transaction_hash": log["transactionHash"],
+                    "topics": log["topics"],
+                    "data": log["data"],
+                }
+                for log in logs
+                if not log.get("removed")
+            ] + new_events
+            to_block = from_block - 1
+
+        # Older events missed by an early stop can't be among the most recent
+        events = [e for e in self.events if e["block_number"] <= final_block] + new_events
+        unique = {(e.get("block_hash"), e.get("log_index"), e["transaction_hash"]): e for e in events}
+        self.events = sorted(
+            unique.values(), key=lambda e: (e["block_number"], e.get("log_index") or 0)
+        )[-self.size:]
+        self.last_block = latest
+        self.store.set(self.key, {
+            "address": self.address,
+            "topic": self.topic,
+            "last_block": self.last_block,
+            "events": self.events,
+        })
+        return self.events
+
+
+async def sequenced_batches(l1, store, size=10):
+    """Batch numbers of the most recent SequenceBatches events, oldest first."""
+    combined = read_json(COMBINED_JSON)
+    cursor = LogCursor(
+        store,
+        "cursor.sequence-batches",
+        combined["rollupAddress"],
+        SEQUENCE_BATCHES_TOPIC,
+        size=size,
+        from_block=combined.get("createRollupBlockNumber", 0),
+    )
+    events = await cursor.update(l1)
+    return [int(event["topics"][1], 16) for event in events]
+
+
+async def main():
+    with StateStore() as store:
+        async with AsyncClient(os.getenv("L1_RPC_URL")) as l1:
+            batch_numbers = await sequenced_batches(l1, store)
+    for batch_number in batch_numbers:
+        print(batch_number)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# This module defines the Prometheus metrics the checks export besides their
+# pass/fail result. Checks update them in the state store, and
+# metrics_exporter.py serves them. It does NOT include a shebang so that the
+# status-checker skips executing this file directly.
+
+import json
+import math
+
+PREFIX = "status_checks_"
+
+# Histogram buckets, in seconds
+DEFAULT_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def _key(name, labels):
+    return f"metric.{name}.{json.dumps(labels, sort_keys=True)}"
+
+
+def set_gauge(store, name, value, help, **labels):
+    store.set(_key(name, labels), {
+        "type": "gauge", "name": name, "help": help, "labels": labels, "value": value,
+    })
+
+
+def delete_metric(store, name, **labels):
+    """Removes a series, e.g. one there is no current value for."""
+    store.delete(_key(name, labels))
+
+
+def observe(store, name, value, help, buckets=DEFAULT_BUCKETS, **labels):
+    """Adds an observation to a histogram."""
+    key = _key(name, labels)
+    with store.transaction():
+        metric = store.get(key) or {
+            "type": "histogram", "name": name, "help": help, "labels": labels,
+            "buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0, "count": 0,
+        }
+        for i, bound in enumerate(metric["buckets"]):
+            if value <= bound:
+                metric["counts"][i] += 1
+        metric["sum"] += value
+        metric["count"] += 1
+        store.set(key, metric)
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _number(value):
+    return "+Inf" if value == math.inf else repr(value)
+
+
+def render(store):
+    """All the metrics in the Prometheus text exposition format."""
+    lines = []
+    described = set()
+    for _, metric in store.items("metric."):
+        name = PREFIX + metric["name"]
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+
+        labels = metric["labels"]
+        if metric["type"] == "gauge":
+            lines.append(f"{name}{_labels(labels)} {_number(metric['value'])}")
+            continue
+        for bound, count in zip(metric["buckets"], metric["counts"]):
+            lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {count}")
+        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {metric['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(metric['sum'])}")
+        lines.append(f"{name}_count{_labels(labels)} {metric['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,35 @@
+# Serves the metrics updated by the checks (see metrics.py) for Prometheus. It
+# runs as its own service, and does NOT include a shebang so that the
+# status-checker skips executing this file as a check.
+
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from metrics import render  # noqa: E402
+from state import StateStore  # noqa: E402
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        with StateStore() as store:
+            body = render(store).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), MetricsHandler).serve_forever()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+# Checks that the RPC is in sync with the sequencer, and exports how far
+# behind it is.
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from jsonrpc import AsyncClient  # noqa: E402
+from lib import check_consensus  # noqa: E402
+from metrics import set_gauge  # noqa: E402
+from state import StateStore  # noqa: E402
+
+check_consensus("rollup", "cdk-validium")
+
+THRESHOLD = 5
+METHODS = ["zkevm_batchNumber", "zkevm_verifiedBatchNumber", "zkevm_virtualBatchNumber"]
+
+
+async def main():
+    methods = METHODS + ["eth_blockNumber"]
+    async with AsyncClient(os.getenv("SEQUENCER_RPC_URL")) as sequencer, AsyncClient(os.getenv("L2_RPC_URL")) as rpc:
+        seq_numbers, rpc_numbers = await asyncio.gather(
+            asyncio.gather(*(sequencer.call(method) for method in methods)),
+            asyncio.gather(*(rpc.call(method) for method in methods)),
+        )
+
+    error = 0
+    with StateStore() as store, store.transaction():
+        for method, seq_number, rpc_number in zip(methods, seq_numbers, rpc_numbers):
+            seq_bn, rpc_bn = int(seq_number, 16), int(rpc_number, 16)
+            set_gauge(
+                store, "rpc_sequencer_lag", seq_bn - rpc_bn,
+                "How far the RPC is behind the sequencer, in batches or blocks.", method=method,
+            )
+            if method in METHODS and abs(seq_bn - rpc_bn) > THRESHOLD:
+                print(f"ERROR: {method} is out of sync, sequencer={seq_bn} rpc={rpc_bn}")
+                error = 1
+    return error
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Checks that the timestamp sequenced on L1 for the most recent batches matches
+# the batch timestamp and the timestamp of its last L2 block.
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from calldata import decode_sequence_batches  # noqa: E402
+from jsonrpc import AsyncClient  # noqa: E402
+from lib import check_consensus  # noqa: E402
+from log_cursor import sequenced_batches  # noqa: E402
+from state import StateStore  # noqa: E402
+
+check_consensus("rollup", "cdk-validium")
+
+
+async def main():
+    with StateStore() as store:
+        async with AsyncClient(os.getenv("L1_RPC_URL")) as l1, AsyncClient(os.getenv("L2_RPC_URL")) as l2:
+            # Ensure that no more than 10 batches sequenced can be processed within
+            # the status-checker check interval.
+            batch_numbers, virtual_batch_number = await asyncio.gather(
+                sequenced_batches(l1, store, 10), l2.call("zkevm_virtualBatchNumber")
+            )
+
+            # Skip the sequenced batches that are greater than the virtual batch.
+            batch_numbers = [n for n in batch_numbers if n <= int(virtual_batch_number, 16)]
+            batches = await asyncio.gather(*(l2.call("zkevm_getBatchByNumber", n) for n in batch_numbers))
+            txs, blocks = await asyncio.gather(
+                asyncio.gather(*(l1.call("eth_getTransactionByHash", b["sendSequencesTxHash"]) for b in batches)),
+                asyncio.gather(*(l2.call("eth_getBlockByHash", b["blocks"][-1], False) for b in batches)),
+            )
+
+    for batch_number, batch, tx, block in zip(batch_numbers, batches, txs, blocks):
+        seq_ts = decode_sequence_batches(tx["input"])["max_sequence_timestamp"]
+        batch_ts = int(batch["timestamp"], 16)
+        block_ts = int(block["timestamp"], 16)
+        if seq_ts != batch_ts or batch_ts != block_ts:
+            print(f"ERROR: batch={batch_number} seq_ts={seq_ts} batch_ts={batch_ts} block_ts={block_ts}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
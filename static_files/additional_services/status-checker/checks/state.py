@@ -0,0 +1,105 @@
+# This module defines the state store shared by the Python-based status checks.
+# It does NOT include a shebang so that the status-checker skips executing this
+# file directly.
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+STATE_DB = os.getenv("STATUS_CHECKER_STATE_DB", "./state.sqlite")
+
+# How long recorded values are kept for rate calculations
+HISTORY_SECONDS = 24 * 60 * 60
+
+
+class StateStore:
+    """Key-value state of the checks, with the history of recorded values.
+
+    Values are stored as JSON in a single SQLite database in WAL mode, so
+    checks running concurrently read without blocking each other. Wrap a
+    read-modify-write in `transaction()` to make it atomic.
+    """
+
+    def __init__(self, path=STATE_DB):
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS history (
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                recorded_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_key_recorded_at ON history (key, recorded_at);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        if self.conn.in_transaction:
+            yield self
+            return
+        # IMMEDIATE takes the write lock upfront, so two checks can't both read
+        # the same value and then overwrite each other's update
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def get(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        self.conn.execute(
+            "INSERT INTO state (key, value, updated_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (key, json.dumps(value), time.time()),
+        )
+
+    def items(self, prefix):
+        """(key, value) pairs of the keys starting with prefix."""
+        rows = self.conn.execute(
+            "SELECT key, value FROM state WHERE substr(key, 1, ?) = ? ORDER BY key",
+            (len(prefix), prefix),
+        )
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def delete(self, key):
+        self.conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def record(self, key, value):
+        """Sets key and appends value to its history."""
+        now = time.time()
+        self.set(key, value)
+        self.conn.execute(
+            "INSERT INTO history (key, value, recorded_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), now),
+        )
+        self.conn.execute(
+            "DELETE FROM history WHERE key = ? AND recorded_at < ?",
+            (key, now - HISTORY_SECONDS),
+        )
+
+    def history(self, key, since=0):
+        """(recorded_at, value) pairs recorded for key since the given time, oldest first."""
+        rows = self.conn.execute(
+            "SELECT recorded_at, value FROM history WHERE key = ? AND recorded_at >= ? ORDER BY recorded_at",
+            (key, since),
+        )
+        return [(recorded_at, json.loads(value)) for recorded_at, value in rows]
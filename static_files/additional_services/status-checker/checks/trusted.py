@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from lib import check_batch, check_consensus  # noqa: E402
+
+check_consensus("rollup", "cdk-validium")
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(check_batch("trusted", "zkevm_batchNumber")))